@@ -0,0 +1,50 @@
+"""
+Compares the peak memory of fitting on wide data with and without partitioning in place.
+Every configuration runs in a fresh process:
+
+    python benchmarks/bench_fit_memory.py
+"""
+from __future__ import print_function
+
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from pyboretum import DecisionTree
+
+NUM_SAMPLES = 20000
+NUM_FEATURES = 500
+
+
+def _fit(growth, partition_in_place):
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(NUM_SAMPLES, NUM_FEATURES))
+    y = X[:, 0] + np.sin(10 * X[:, 1]) + rng.normal(size=NUM_SAMPLES)
+    data_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tree = DecisionTree(min_samples_leaf=20, max_bins=32, growth=growth,
+                        partition_in_place=partition_in_place)
+    start = time.time()
+    tree.fit(X, y)
+
+    # ru_maxrss is in kilobytes on Linux:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('{} (in place: {}): fit {:.1f}s, peak RSS above data {:.0f} MB (data {:.0f} MB)'.format(
+        growth, partition_in_place, time.time() - start, (peak_rss - data_rss) / 1024.,
+        X.nbytes / 2. ** 20))
+
+
+def main():
+    for growth in ['depth_first', 'breadth_first']:
+        for partition_in_place in [False, True]:
+            subprocess.check_call([sys.executable, __file__, growth, str(partition_in_place)])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        _fit(sys.argv[1], sys.argv[2] == 'True')
+    else:
+        main()
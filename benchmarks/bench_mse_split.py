@@ -0,0 +1,65 @@
+"""
+Compares the vectorized MSE cutpoint search against the original sequential scan.
+
+    python benchmarks/bench_mse_split.py
+"""
+from __future__ import print_function
+
+import time
+
+import numpy as np
+
+from pyboretum.splitters import MSESplitter
+
+
+def sequential_cutpoint(splitter, feature, Y, min_samples_leaf):
+    """
+    The original implementation of MSESplitter._get_ordered_cutpoint() up to the cutpoint.
+    """
+    sorted_idx = np.argsort(feature)
+    feature = feature[sorted_idx]
+    Y = Y[sorted_idx]
+
+    Sr, Nr = Y.sum(axis=0), len(feature)
+    Sl, Nl = np.zeros(Y.shape[1]), 0
+    bestTillNow = 0.0
+    best_cutpoint = None
+    for i in range(feature.shape[0] - 1):
+        Sl += Y[i]
+        Sr -= Y[i]
+        Nl += 1
+        Nr -= 1
+        if (feature[i + 1] > feature[i]) and (min(Nl, Nr) >= min_samples_leaf):
+            newSplitValue = (splitter.mahalanobis_distance(np.array([Sl])) / Nl) + \
+                            (splitter.mahalanobis_distance(np.array([Sr])) / Nr)
+            if newSplitValue > bestTillNow:
+                bestTillNow = newSplitValue
+                best_cutpoint = (feature[i] + feature[i + 1]) / 2.
+
+    return best_cutpoint
+
+
+def main():
+    rng = np.random.RandomState(0)
+    splitter = MSESplitter()
+    splitter.inverse_covariance_matrix = np.identity(1)
+
+    for num_samples in [100000, 1000000]:
+        feature = rng.randint(0, num_samples // 10, size=num_samples).astype(float)
+        Y = (feature > num_samples // 20).reshape(-1, 1) + rng.normal(size=(num_samples, 1))
+
+        start = time.time()
+        expected = sequential_cutpoint(splitter, feature, Y, 5)
+        sequential_time = time.time() - start
+
+        start = time.time()
+        cutpoint, _ = splitter._get_ordered_cutpoint(feature, Y, 5)
+        vectorized_time = time.time() - start
+
+        assert cutpoint == expected
+        print('{} samples: sequential {:.3f}s, vectorized {:.3f}s ({:.0f}x)'.format(
+            num_samples, sequential_time, vectorized_time, sequential_time / vectorized_time))
+
+
+if __name__ == '__main__':
+    main()
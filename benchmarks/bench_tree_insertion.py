@@ -0,0 +1,54 @@
+"""
+Measures how long it takes to grow trees with tens of thousands of nodes.
+
+    python benchmarks/bench_tree_insertion.py
+"""
+from __future__ import print_function
+
+import time
+
+import numpy as np
+
+from pyboretum import (
+    DecisionTree,
+    LinkedTree,
+    MeanNode,
+)
+
+
+def grow_balanced_tree(tree_class, num_nodes):
+    X = np.zeros((1, 1))
+    Y = np.zeros((1, 1))
+    node = MeanNode(X, Y, None, None)
+
+    tree = tree_class(node)
+    frontier = [tree.get_root_id()]
+    while 2 * len(frontier) + 1 <= num_nodes:
+        node_id = frontier.pop(0)
+        frontier.extend(tree.insert_children(node_id,
+                                             MeanNode(X, Y, None, None),
+                                             MeanNode(X, Y, None, None)))
+
+    return tree
+
+
+def main():
+    for num_nodes in [1000, 10000, 50000]:
+        start = time.time()
+        grow_balanced_tree(LinkedTree, num_nodes)
+        print('Inserting {} nodes into LinkedTree: {:.3f}s'.format(num_nodes, time.time() - start))
+
+    rng = np.random.RandomState(0)
+    for num_samples in [5000, 20000]:
+        X = rng.uniform(size=(num_samples, 1))
+        y = np.sin(20 * X[:, 0]) + rng.normal(scale=.1, size=num_samples)
+
+        tree = DecisionTree(tree_class=LinkedTree, min_samples_leaf=1)
+        start = time.time()
+        tree.fit(X, y)
+        print('Fitting {} samples ({} nodes): {:.3f}s'.format(
+            num_samples, len(tree.get_nodes_and_edges(float('inf'))[0]), time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
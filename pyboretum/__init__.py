@@ -1,6 +1,8 @@
 from __future__ import absolute_import
 
 from .decision_tree import DecisionTree
+from .forest import RandomForest
+from .boosting import GradientBoosting
 from . import splitters
 from .node import (
     Node,
@@ -11,6 +13,8 @@ from .node import (
 from .tree import (
     LinkedTree,
     ListTree,
+    SparseListTree,
+    CompiledTree,
 )
 
 from .training_data import TrainingData
\ No newline at end of file
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+from pyboretum.decision_tree import DecisionTree
+from pyboretum.histogram import Histogram
+from pyboretum.node import MeanMedianAnalysisNode
+from pyboretum.splitters import (
+    MAESplitter,
+    MSESplitter,
+)
+from pyboretum.training_data import TrainingData
+from pyboretum.tree import CompiledTree
+from pyboretum.utils import get_column_positions
+
+# Splitter that fits the trees, and the function of the initial prediction, by loss:
+_LOSSES = {
+    'squared_error': (MSESplitter, np.mean),
+    'absolute_error': (MAESplitter, np.median),
+}
+
+# Upper bound on the (row, tree) pairs that .predict() routes together:
+_MAX_ROUTED_PAIRS = 2 ** 20
+
+
+def _get_leaves(tree):
+    """
+    :param tree: a Tree object
+    :return: a generator of the leaf nodes of tree
+    """
+    stack = [tree.get_root_id()]
+    while stack:
+        node_id = stack.pop()
+        left_id, right_id = tree.get_children_ids(node_id)
+        if left_id is None:
+            yield tree.get_node(node_id)[0]
+        else:
+            stack.extend([right_id, left_id])
+
+
+class GradientBoosting(object):
+    """
+    Gradient-boosted DecisionTrees. Every round fits a tree to the residuals of the current
+    predictions and adds its leaf values, times learning_rate, to them:
+
+        squared_error: MSESplitter trees with the mean residual of every leaf
+        absolute_error: MAESplitter trees with the median residual of every leaf, which is the
+                        optimal step for the absolute error within the leaf
+
+    Predictions of the training data are updated from the IDs that every leaf saves during
+    fitting (see Node.SAVE_IDS) instead of predicting the training data again, so a round
+    costs a single fit. Presorting or binning of X (see DecisionTree) is also done once for
+    all rounds.
+    """
+    def __init__(self, n_estimators=100, learning_rate=0.1, loss='squared_error',
+                 node_class=MeanMedianAnalysisNode, **tree_params):
+        """
+        :param n_estimators: number of boosting rounds
+        :param learning_rate: factor of the leaf values added in every round
+        :param loss: 'squared_error' or 'absolute_error'
+        :param node_class: a Node class with SAVE_IDS and the Y_FUNS of the splitter's
+                           pred_str
+        :param tree_params: other parameters of every DecisionTree, e.g., max_depth,
+                            min_samples_leaf, presort or max_bins
+        """
+        assert loss in _LOSSES, 'Unknown loss: {}'.format(loss)
+        assert node_class.SAVE_IDS, 'node_class should save IDs (see Node.SAVE_IDS).'
+
+        self.n_estimators = n_estimators
+        self.learning_rate = learning_rate
+        self.loss = loss
+        self.node_class = node_class
+        self.tree_params = tree_params
+
+        # These are initialized by .fit()
+        self.pred_str = None
+        self.trees = None
+        self.init_prediction = None
+        self.train_errors = None
+        self.X_names = None
+        self.Y_names = None
+
+        # All trees in one CompiledTree, and the node ID of the root of each tree:
+        self._tree = None
+        self._root_ids = None
+
+    def _get_error(self, residuals):
+        if self.loss == 'absolute_error':
+            return np.mean(np.abs(residuals))
+        else:
+            return np.mean(np.square(residuals))
+
+    def fit(self, X, Y, splitter=None):
+        """
+        Runs the boosting rounds. train_errors holds the loss of the training predictions
+        after every round.
+
+        :param X: DataFrame, numpy matrix or scipy sparse matrix (preferably CSC) of features
+        :param Y: DataFrame, Series or numpy array of targets
+        :param splitter: a Splitter object; the splitter of the loss by default
+        """
+        splitter_class, init_fun = _LOSSES[self.loss]
+        splitter = splitter_class() if splitter is None else splitter
+        self.pred_str = splitter.pred_str
+        assert self.pred_str in self.node_class.Y_FUNS, \
+            'node_class does not compute {}.'.format(self.pred_str)
+
+        # Rows are identified by position, which is what saved IDs of numpy data hold:
+        training_data = TrainingData(X, Y)
+        self.X_names = training_data.X_names
+        self.Y_names = training_data.Y_names
+        X_np, Y_np = training_data.X, training_data.Y.astype(float)
+
+        decision_tree = DecisionTree(node_class=self.node_class, **self.tree_params)
+        in_place = decision_tree.partition_in_place or decision_tree.compact_ids
+        if decision_tree.presort:
+            training_data.presort()
+        if decision_tree.max_bins is not None:
+            training_data.bin(decision_tree.max_bins)
+
+        self.init_prediction = init_fun(Y_np, axis=0)
+        predicted = np.tile(self.init_prediction, (Y_np.shape[0], 1))
+        self.trees = []
+        self.train_errors = []
+        for _ in range(self.n_estimators):
+            residuals = Y_np - predicted
+
+            # X is the same in every round, so sorting and binning are reused. Partitioning
+            # in place reorders them, so it gets copies:
+            sorted_idx = training_data.sorted_idx
+            histogram = training_data.histogram
+            if in_place and sorted_idx is not None:
+                sorted_idx = sorted_idx.copy()
+            if histogram is not None:
+                histogram = Histogram(histogram.codes.copy() if in_place else histogram.codes,
+                                      histogram.bin_edges, histogram.num_bins)
+            round_data = TrainingData(X_np, residuals, sorted_idx=sorted_idx, histogram=histogram,
+                                      feature_types=training_data.feature_types)
+            if in_place:
+                round_data.partition_in_place()
+
+            tree = DecisionTree(node_class=self.node_class, **self.tree_params)
+            tree._fit_training_data(round_data, splitter)
+
+            for node in _get_leaves(tree.tree):
+                predicted[node.saved_ids] += self.learning_rate * getattr(node, self.pred_str)
+
+            # Compiled trees drop the saved IDs, which are no longer needed:
+            tree.compile()
+            tree.X_names, tree.Y_names = self.X_names, self.Y_names
+            self.trees.append(tree)
+            self.train_errors.append(self._get_error(Y_np - predicted))
+
+        self._tree, self._root_ids = CompiledTree.concatenate([tree.tree for tree in self.trees])
+
+    def predict(self, X):
+        """
+        :param X: DataFrame, numpy matrix or scipy sparse matrix (preferably CSR) of features
+        :return: a DataFrame with columns Y_names and the index of X if X is a DataFrame,
+                 otherwise a numpy array
+        """
+        X_np = (X.iloc[:, get_column_positions(self.X_names, X.columns)].values
+                if isinstance(X, pd.DataFrame) else X)
+
+        # Batches of trees route all rows together, one level at a time, and add their values
+        # to the sum. Batches are small enough that memory does not grow with n_estimators:
+        num_rows = X_np.shape[0]
+        batch_size = max(1, _MAX_ROUTED_PAIRS // max(num_rows, 1))
+        predicted = np.tile(self.init_prediction, (num_rows, 1)).astype(float)
+        for start in range(0, len(self._root_ids), batch_size):
+            root_ids = self._root_ids[start:start + batch_size]
+            leaf_ids = self._tree.route(X_np, np.tile(np.arange(num_rows), len(root_ids)),
+                                        np.repeat(root_ids, num_rows))
+            values = self._tree.values[self.pred_str][leaf_ids]
+            values = values.reshape((len(root_ids), num_rows) + values.shape[1:])
+            predicted += self.learning_rate * values.sum(axis=0)
+
+        if isinstance(X, pd.DataFrame):
+            return pd.DataFrame(predicted, columns=self.Y_names, index=X.index)
+        else:
+            return predicted
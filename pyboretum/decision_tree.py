@@ -1,21 +1,149 @@
+import collections
+import copy
+import functools
+import heapq
+import itertools
+import math
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import pickle
+
 from graphviz import Digraph
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 from pyboretum.splitters import MSESplitter
-from pyboretum.tree import LinkedTree
-from pyboretum.node import MeanNode
+from pyboretum.tree import (
+    LinkedTree,
+    SparseListTree,
+    CompiledTree,
+)
+from pyboretum.node import (
+    IdRange,
+    MeanNode,
+)
 from pyboretum.training_data import TrainingData
+from pyboretum.utils import (
+    get_column_positions,
+    get_num_jobs,
+    get_optional_kwargs,
+)
+
+# File that DecisionTree.save() writes next to the arrays of the tree:
+_PICKLE_FILE_NAME = 'decision_tree.pkl'
+
+
+def _grow_subtree(decision_tree, splitter, node, training_data, depth):
+    """
+    Grows the subtree below node in a worker process.
+
+    :return: a SparseListTree rooted at (a copy of) node
+    """
+    decision_tree.tree = SparseListTree(node)
+    decision_tree._fit_core(splitter, decision_tree.tree.get_root_id(), node, training_data, depth)
+
+    return decision_tree.tree
+
+
+def _split_rows(X, chunk_size):
+    """
+    :param X: DataFrame, numpy matrix or scipy sparse matrix
+    :return: a generator of consecutive chunks of at most chunk_size rows of X
+    """
+    rows = X.iloc if isinstance(X, pd.DataFrame) else X
+    for begin in range(0, X.shape[0], chunk_size):
+        yield rows[begin:begin + chunk_size]
+
+
+class _WorkQueue(object):
+    """
+    Nodes waiting to be split, ordered by the growth strategy:
+
+        depth_first: the most recently added node first, left before right
+        breadth_first: the oldest node first, i.e., level by level
+        best_first: the node with the largest priority first; ties go to the older node
+    """
+    GROWTH_STRATEGIES = ('depth_first', 'breadth_first', 'best_first')
+
+    def __init__(self, growth):
+        assert growth in self.GROWTH_STRATEGIES, 'Unknown growth strategy: {}'.format(growth)
+        self._growth = growth
+        self._items = collections.deque() if growth == 'breadth_first' else []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._items)
+
+    def push(self, item, priority=None):
+        if self._growth == 'best_first':
+            heapq.heappush(self._items, (-priority, next(self._counter), item))
+        else:
+            self._items.append(item)
+
+    def push_children(self, left_item, right_item, left_priority=None, right_priority=None):
+        if self._growth == 'depth_first':
+            # The stack pops the left child first:
+            self.push(right_item, right_priority)
+            self.push(left_item, left_priority)
+        else:
+            self.push(left_item, left_priority)
+            self.push(right_item, right_priority)
+
+    def pop(self):
+        if self._growth == 'best_first':
+            return heapq.heappop(self._items)[-1]
+        elif self._growth == 'breadth_first':
+            return self._items.popleft()
+        else:
+            return self._items.pop()
 
 
 class DecisionTree(object):
     def __init__(self, tree_class=LinkedTree, node_class=MeanNode,
-                 max_depth=float('inf'), min_samples_leaf=1):
+                 max_depth=float('inf'), min_samples_leaf=1, presort=False, max_bins=None,
+                 n_jobs=1, parallel_min_samples=1000, growth='depth_first', max_leaf_nodes=None,
+                 partition_in_place=False, compact_ids=False):
+        """
+        :param presort: sort every feature once before fitting instead of sorting at every
+                        node. This is faster for large data but keeps an index matrix as
+                        large as X in memory.
+        :param max_bins: if given, quantize every feature into at most this many bins and
+                         only search cuts between bins. This trades exact cutpoints for
+                         speed on large data.
+        :param n_jobs: number of processes used to grow subtrees in parallel, or -1 for one
+                       per CPU. The fitted tree is the same as with a single process.
+        :param parallel_min_samples: subtrees with fewer samples are grown in the main
+                                     process since sending them to a worker costs more than
+                                     it saves.
+        :param growth: the order in which nodes are split; one of 'depth_first',
+                       'breadth_first' or 'best_first' (largest reduction in cost first).
+                       This only changes the tree when max_leaf_nodes stops the growth.
+        :param max_leaf_nodes: if given, stop splitting once the tree has this many leaves
+        :param partition_in_place: copy the training data once and reorder it in place as the
+                                   tree grows, instead of copying the rows of every node.
+                                   This reduces memory use on wide data.
+        :param compact_ids: if node_class saves IDs (see Node.SAVE_IDS), every node keeps them
+                            as an IdRange into one permutation of IDs shared by the whole tree
+                            instead of its own copy. IDs within a node are then in the order
+                            of that permutation. This implies partition_in_place.
+        """
+        assert growth in _WorkQueue.GROWTH_STRATEGIES, 'Unknown growth strategy: {}'.format(growth)
+
         self.tree_class = tree_class
         self.node_class = node_class
 
         self.max_depth = max_depth
         self.min_samples_leaf = min_samples_leaf
+        self.presort = presort
+        self.max_bins = max_bins
+        self.n_jobs = n_jobs
+        self.parallel_min_samples = parallel_min_samples
+        self.growth = growth
+        self.max_leaf_nodes = max_leaf_nodes
+        self.partition_in_place = partition_in_place
+        self.compact_ids = compact_ids
 
         # These are initialized by .fit()
         self.pred_str = None
@@ -24,40 +152,137 @@ class DecisionTree(object):
         self.Y_names = None
 
     def _build_node(self, splitter, training_data):
+        # Statistics of the children that the splitter knows are passed on to their nodes:
+        training_data.child_stats = {}
+        # Options are only passed if they are set and the splitter accepts them, so that
+        # splitters without these options still work:
+        kwargs = get_optional_kwargs(splitter.select_feature_to_cut,
+                                     sorted_idx=training_data.sorted_idx,
+                                     histogram=training_data.histogram,
+                                     feature_types=training_data.feature_types,
+                                     child_stats=training_data.child_stats)
         coeffs, threshold, cost = splitter.select_feature_to_cut(training_data.X,
                                                                  training_data.Y,
-                                                                 self.min_samples_leaf)
+                                                                 self.min_samples_leaf,
+                                                                 **kwargs)
 
         # TODO: this needs to be enabled later when statistical tests are used to select variables.
         # if threshold is None:
         #     threshold, cost = self.splitter.get_best_cutpoint()
 
-        node = self.node_class(training_data.X, training_data.Y, coeffs, threshold, training_data.index)
+        if self.compact_ids:
+            # Rows of the node stay in this range while the index is reordered below it:
+            index = IdRange(training_data.root_index, training_data.index_offset,
+                            training_data.index_offset + training_data.X.shape[0])
+        elif training_data.in_place:
+            # The index of in-place training data is reordered later, so nodes keep a copy:
+            index = np.array(training_data.index)
+        else:
+            index = training_data.index
+        node = self.node_class(training_data.X, training_data.Y, coeffs, threshold, index,
+                               stats=training_data.stats)
 
-        return node
+        return node, cost
 
-    def _fit_core(self, splitter, node_id, node, training_data, depth):
-        if depth == self.max_depth or node.coeffs is None:
-            return
+    def _get_priority(self, splitter, node, cost, training_data):
+        """
+        Priority of splitting node in best-first growth: the total reduction in cost.
+        """
+        if self.growth != 'best_first' or node.coeffs is None:
+            return 0.0
         else:
-            left_data, right_data = training_data.get_descendants(node)
+            return node.n_samples * (splitter.get_node_cost(training_data.Y) - cost)
+
+    def _fit_core(self, splitter, node_id, node, training_data, depth, priority=0.0,
+                  pool=None, pending=None):
+        """
+        Grows the subtree below node with a work queue ordered by self.growth. If pool is
+        given, subtrees at least _parallel_depth deep are grown asynchronously, and (node ID,
+        result) pairs are appended to pending.
+        """
+        queue = _WorkQueue(self.growth)
+        queue.push((node_id, node, training_data, depth), priority)
+        num_leaves = 1
+
+        while len(queue) > 0:
+            if self.max_leaf_nodes is not None and num_leaves >= self.max_leaf_nodes:
+                # Nodes that are not split anymore become leaves:
+                while len(queue) > 0:
+                    queue.pop()[1].drop_cut()
+                break
+
+            node_id, node, training_data, depth = queue.pop()
+            if depth == self.max_depth or node.coeffs is None:
+                continue
+
+            elif (pool is not None and depth >= self._parallel_depth and
+                  node.n_samples >= self.parallel_min_samples):
+                worker_tree = DecisionTree(node_class=self.node_class,
+                                           max_depth=self.max_depth,
+                                           min_samples_leaf=self.min_samples_leaf,
+                                           compact_ids=self.compact_ids)
+                pending.append((node_id, pool.apply_async(_grow_subtree,
+                                                          (worker_tree, splitter, node,
+                                                           training_data, depth))))
+
+            else:
+                left_data, right_data = training_data.get_descendants(node)
+
+                left_node, left_cost = self._build_node(splitter, left_data)
+                right_node, right_cost = self._build_node(splitter, right_data)
+
+                left_id, right_id = self.tree.insert_children(node_id, left_node, right_node)
+                num_leaves += 1
 
-            left_node = self._build_node(splitter, left_data)
-            right_node = self._build_node(splitter, right_data)
+                queue.push_children((left_id, left_node, left_data, depth + 1),
+                                    (right_id, right_node, right_data, depth + 1),
+                                    self._get_priority(splitter, left_node, left_cost, left_data),
+                                    self._get_priority(splitter, right_node, right_cost, right_data))
 
-            left_id, right_id = self.tree.insert_children(node_id, left_node, right_node)
+    @property
+    def _parallel_depth(self):
+        # Enough levels to give every worker about two subtrees in a balanced tree:
+        return int(math.ceil(math.log(get_num_jobs(self.n_jobs), 2))) + 1
 
-            self._fit_core(splitter, left_id, left_node, left_data, depth + 1)
-            self._fit_core(splitter, right_id, right_node, right_data, depth + 1)
+    def _graft(self, node_id, subtree):
+        """
+        Inserts the descendants of the root of subtree below node_id.
+        """
+        stack = [(node_id, subtree.get_root_id())]
+        while stack:
+            node_id, subtree_id = stack.pop()
+            subtree_left_id, subtree_right_id = subtree.get_children_ids(subtree_id)
+            if subtree_left_id is not None:
+                left_id, right_id = self.tree.insert_children(node_id,
+                                                              subtree.get_node(subtree_left_id)[0],
+                                                              subtree.get_node(subtree_right_id)[0])
+                stack.append((right_id, subtree_right_id))
+                stack.append((left_id, subtree_left_id))
 
     def fit(self, X, Y, splitter=None):
         """
-        How to do this without recursion??? where to store split feature/values? how to keep track of filtered X
-        :param X:
-        :param Y:
-        :return:
+        Grows the tree from a work queue of nodes to split (see the growth parameter).
+
+        :param X: DataFrame, numpy matrix or scipy sparse matrix (preferably CSC) of features.
+                  Sparse X cannot be used with presort, max_bins or partition_in_place.
+        :param Y: DataFrame, Series or numpy array of targets
+        :param splitter: a Splitter object; MSESplitter by default
         """
         training_data = TrainingData(X, Y)
+        if self.presort:
+            training_data.presort()
+        if self.max_bins is not None:
+            training_data.bin(self.max_bins)
+        if self.partition_in_place or self.compact_ids:
+            training_data.partition_in_place()
+
+        self._fit_training_data(training_data, splitter)
+
+    def _fit_training_data(self, training_data, splitter=None):
+        """
+        Same as .fit() for TrainingData that is already presorted, binned and/or partitioned
+        in place as needed.
+        """
         splitter = MSESplitter() if splitter is None else splitter
 
         self.X_names = training_data.X_names
@@ -66,67 +291,208 @@ class DecisionTree(object):
         # TODO: how can we ensure that the information used by pred_str is defined in the node?
         self.pred_str = splitter.pred_str
 
-        root_node = self._build_node(splitter, training_data)
+        root_node, root_cost = self._build_node(splitter, training_data)
         self.tree = self.tree_class(root_node)
+        priority = self._get_priority(splitter, root_node, root_cost, training_data)
 
-        self._fit_core(splitter, self.tree.get_root_id(), root_node, training_data, 0)
+        # A leaf budget is shared by the whole tree, so it cannot be split between workers:
+        if get_num_jobs(self.n_jobs) <= 1 or self.max_leaf_nodes is not None:
+            self._fit_core(splitter, self.tree.get_root_id(), root_node, training_data, 0,
+                           priority)
 
-    def _get_leaf_node(self, x_row):
+        else:
+            pool = multiprocessing.Pool(get_num_jobs(self.n_jobs))
+            try:
+                pending = []
+                self._fit_core(splitter, self.tree.get_root_id(), root_node, training_data, 0,
+                               priority, pool, pending)
+
+                for node_id, result in pending:
+                    self._graft(node_id, result.get())
+            finally:
+                pool.terminate()
+
+    def compile(self):
         """
-        :param x_row: a single observation (row of X)
-        :return: the ID and node object of the leaf
+        Replaces the fitted tree with a CompiledTree, which stores the tree in a few flat
+        numpy arrays. This makes .predict() and .apply() faster and the pickled tree much
+        smaller. Note that node IDs change to positions in the compiled arrays.
+
+        :return: self
         """
-        iterator = self.tree.get_iterator()
-        while not iterator.is_leaf():
-            node, _ = iterator.get_node()
-            branch = node.should_take_left(x_row)
+        if not isinstance(self.tree, CompiledTree):
+            self.tree = CompiledTree.from_tree(self.tree)
 
-            if branch:
-                iterator.left_child()
-            else:
-                iterator.right_child()
+        return self
 
-        # current node is now a leaf node
-        node, _ = iterator.get_node()
-        return iterator.get_id(), node
+    def save(self, path):
+        """
+        Writes the fitted tree as a directory of .npy files (see CompiledTree.save()) and the
+        rest of this object as a small pickle, so that .load() can memory-map the tree. The
+        tree is compiled for saving if it is not already, but this object is not changed.
+
+        :param path: a directory name
+        """
+        tree = self.tree if isinstance(self.tree, CompiledTree) else CompiledTree.from_tree(self.tree)
+        tree.save(path)
+
+        # Everything but the tree is pickled:
+        decision_tree = copy.copy(self)
+        decision_tree.tree = None
+        with open(os.path.join(path, _PICKLE_FILE_NAME), 'wb') as f:
+            pickle.dump(decision_tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Reads a DecisionTree written by .save(). Its tree is a CompiledTree whose arrays are
+        memory-mapped by default (see CompiledTree.load()).
+
+        :param path: a directory name
+        :param mmap_mode: passed to numpy.load(); None reads the arrays into memory
+        :return: a DecisionTree object
+        """
+        with open(os.path.join(path, _PICKLE_FILE_NAME), 'rb') as f:
+            decision_tree = pickle.load(f)
+        decision_tree.tree = CompiledTree.load(path, mmap_mode=mmap_mode)
+
+        return decision_tree
+
+    def _route(self, X):
+        """
+        Routes all rows of X through the tree at once. Each internal node evaluates its
+        decision rule a single time on the subset of rows that reach it.
+
+        :param X: numpy matrix or scipy sparse matrix
+        :return: a tuple of (list of leaf IDs, list of leaf Node objects, numpy array with
+                 the position of the leaf reached by each row in those lists)
+        """
+        if sparse.issparse(X):
+            # Subsets of rows are taken at every node:
+            X = X.tocsr()
+
+        leaf_ids = []
+        leaf_nodes = []
+        leaf_positions = np.empty(X.shape[0], dtype=np.intp)
+
+        stack = [(self.tree.get_root_id(), np.arange(X.shape[0]))]
+        while stack:
+            node_id, rows = stack.pop()
+            node, _ = self.tree.get_node(node_id)
+            left_id, right_id = self.tree.get_children_ids(node_id)
+
+            if left_id is None:
+                leaf_positions[rows] = len(leaf_ids)
+                leaf_ids.append(node_id)
+                leaf_nodes.append(node)
+
+            elif rows.shape[0] > 0:
+                mask = node.should_take_left(X, rows)
+                stack.append((right_id, rows[~mask]))
+                stack.append((left_id, rows[mask]))
+
+        return leaf_ids, leaf_nodes, leaf_positions
 
     def apply(self, X):
+        """
+        :param X: DataFrame, numpy matrix or scipy sparse matrix (preferably CSR) of features
+        :return: a numpy array with the ID of the leaf node each row falls into
+        """
         if isinstance(X, pd.DataFrame):
             X = X.values
 
-        node_ids = []
-        for row in range(X.shape[0]):
-            node_id, _ = self._get_leaf_node(X[row, :])
-            node_ids.append(node_id)
+        if isinstance(self.tree, CompiledTree):
+            return self.tree.apply(X)
 
-        return node_ids
+        leaf_ids, _, leaf_positions = self._route(X)
 
-    def predict(self, X, pred_str=None):
-        if isinstance(X, pd.DataFrame):
-            # TODO: this needs to be tested
-            # Match column order with the training data:
-            missing_columns = [name for name in self.X_names if name not in X.columns]
-            if missing_columns:
-                raise ValueError('Following columns are missing from X: {}'.format(missing_columns))
+        return np.asarray(leaf_ids)[leaf_positions]
 
-            X_np = X[self.X_names].values
-            
+    def _predict_values(self, X, pred_str):
+        """
+        :param X: numpy matrix or scipy sparse matrix with columns in the order of X_names
+        :return: a numpy array with the pred_str value of the leaf each row falls into
+        """
+        if isinstance(self.tree, CompiledTree):
+            return self.tree.values[pred_str][self.tree.apply(X)]
         else:
-            X_np = X
+            _, leaf_nodes, leaf_positions = self._route(X)
+            return np.array([getattr(node, pred_str) for node in leaf_nodes])[leaf_positions]
+
+    def _predict_blocks(self, X, pred_str, n_jobs, block_size):
+        """
+        Same as ._predict_values() but with blocks of block_size rows predicted on a pool of
+        n_jobs threads. Routing rows is mostly numpy work that releases the GIL, especially
+        with a compiled tree, and threads share X and the tree without copying them.
+        """
+        if get_num_jobs(n_jobs) <= 1 or X.shape[0] <= block_size:
+            return self._predict_values(X, pred_str)
 
+        if sparse.issparse(X):
+            # Blocks of rows are taken below:
+            X = X.tocsr()
+
+        pool = ThreadPool(get_num_jobs(n_jobs))
+        try:
+            # .map() returns the blocks in their original order:
+            predicted = pool.map(functools.partial(self._predict_values, pred_str=pred_str),
+                                 _split_rows(X, block_size))
+        finally:
+            pool.terminate()
+
+        return np.concatenate(predicted)
+
+    def predict(self, X, pred_str=None, n_jobs=1, block_size=100000):
+        """
+        :param X: DataFrame, numpy matrix or scipy sparse matrix of features. The columns of
+                  a DataFrame are matched with the training data by name.
+        :param pred_str: name of the node value to predict; the splitter's default if None
+        :param n_jobs: number of threads that predict blocks of rows in parallel, or -1 for
+                       one per CPU. This is most effective after .compile().
+        :param block_size: number of rows per block when n_jobs is not 1
+        :return: a DataFrame with columns Y_names and the index of X if X is a DataFrame,
+                 otherwise a numpy array
+        """
         # Override the default pred_str:
         # TODO: how can we ensure that the information used by pred_str is defined in the node?
         pred_str = pred_str or self.pred_str
 
-        predicted = []
-        for row in range(X.shape[0]):
-            _, node = self._get_leaf_node(X_np[row, :])
-            predicted.append(getattr(node, pred_str))
-
         if isinstance(X, pd.DataFrame):
+            # Match column order with the training data:
+            X_np = X.iloc[:, get_column_positions(self.X_names, X.columns)].values
+            predicted = self._predict_blocks(X_np, pred_str, n_jobs, block_size)
             return pd.DataFrame(predicted, columns=self.Y_names, index=X.index)
         else:
-            return np.array(predicted)
+            return self._predict_blocks(X, pred_str, n_jobs, block_size)
+
+    def predict_chunks(self, chunks, pred_str=None, chunk_size=10000):
+        """
+        Predicts one chunk of rows at a time, so that only a chunk of X is in memory at once.
+        All DataFrame chunks are expected to have the same columns as the first one, which
+        are matched with the training data only once.
+
+        :param chunks: an iterable of DataFrames or numpy matrices, e.g.,
+                       pd.read_csv(..., chunksize=...). A single DataFrame or numpy matrix
+                       (e.g., a numpy.memmap) is split into chunks of chunk_size rows.
+        :param pred_str: see .predict()
+        :param chunk_size: number of rows per chunk when chunks is a single matrix
+        :return: a generator of predictions, one per chunk, as .predict() would return them
+        """
+        pred_str = pred_str or self.pred_str
+
+        if isinstance(chunks, (pd.DataFrame, np.ndarray)) or sparse.issparse(chunks):
+            chunks = _split_rows(chunks, chunk_size)
+
+        column_positions = None
+        for chunk in chunks:
+            if isinstance(chunk, pd.DataFrame):
+                if column_positions is None:
+                    column_positions = get_column_positions(self.X_names, chunk.columns)
+
+                predicted = self._predict_values(chunk.iloc[:, column_positions].values, pred_str)
+                yield pd.DataFrame(predicted, columns=self.Y_names, index=chunk.index)
+            else:
+                yield self._predict_values(chunk, pred_str)
 
     def _get_nodes_and_edges(self, node_id, max_depth):
         node, depth = self.tree.get_node(node_id)
@@ -0,0 +1,279 @@
+import copy
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from pyboretum.decision_tree import DecisionTree
+from pyboretum.histogram import Histogram
+from pyboretum.splitters import MSESplitter
+from pyboretum.training_data import TrainingData
+from pyboretum.tree import CompiledTree
+from pyboretum.utils import (
+    get_column_positions,
+    get_num_jobs,
+)
+
+# Arrays of the training data that worker processes memory-map instead of receiving them
+# pickled with every tree:
+_SHARED_ARRAYS = ('X', 'Y', 'sorted_idx', 'codes')
+
+# Training data in a worker process, set by _init_worker():
+_worker_data = None
+
+# Functions that combine the predictions of trees, without and with missing values, by
+# pred_str. Other values are averaged:
+_REDUCERS = {
+    'median': (np.median, np.nanmedian),
+}
+_DEFAULT_REDUCERS = (np.mean, np.nanmean)
+
+
+def get_sorted_idx_of_sample(sorted_idx, counts):
+    """
+    Derives the positions that sort the columns of a sample of rows from the positions that
+    sort all rows (see TrainingData.presort()), in O(n) per feature instead of sorting again.
+
+    :param sorted_idx: numpy matrix whose columns are the positions that sort all rows
+    :param counts: numpy array of the number of copies of each row in the sample. The sample
+                   holds the rows in ascending order with their copies next to each other.
+    :return: numpy matrix of positions in the sample, in the order of a stable sort
+    """
+    starts = np.cumsum(counts) - counts
+    sample_sorted_idx = np.empty((counts.sum(), sorted_idx.shape[1]), dtype=sorted_idx.dtype)
+    for idx in range(sorted_idx.shape[1]):
+        repeats = counts[sorted_idx[:, idx]]
+        first_copies = np.repeat(starts[sorted_idx[:, idx]], repeats)
+        # Position of every copy among the copies of its row:
+        copies = np.arange(first_copies.shape[0]) - np.repeat(np.cumsum(repeats) - repeats,
+                                                              repeats)
+        sample_sorted_idx[:, idx] = first_copies + copies
+
+    return sample_sorted_idx
+
+
+def _fit_tree(data, decision_tree, splitter, seed, bootstrap):
+    """
+    Fits a copy of decision_tree on a bootstrap sample of the training data and predicts the
+    rows that are out of the sample.
+
+    :param data: a dictionary with the training data arrays X and Y, feature_types, and
+                 either sorted_idx, or codes, bin_edges and num_bins of a Histogram if the
+                 data were presorted or binned
+    :return: a tuple of (compiled DecisionTree, numpy array of out-of-bag rows, numpy matrix
+             of their predictions)
+    """
+    decision_tree = copy.deepcopy(decision_tree)
+    splitter = copy.deepcopy(splitter)
+
+    X, Y = data['X'], data['Y']
+    random_state = np.random.RandomState(seed)
+    if bootstrap:
+        counts = np.bincount(random_state.randint(X.shape[0], size=X.shape[0]),
+                             minlength=X.shape[0])
+    else:
+        counts = np.ones(X.shape[0], dtype=np.intp)
+    # Random choices of the splitter differ between trees:
+    splitter.random_state = random_state
+
+    rows = np.repeat(np.arange(X.shape[0]), counts)
+    training_data = TrainingData(np.asarray(X[rows]), np.asarray(Y[rows]), index=rows,
+                                 feature_types=data['feature_types'])
+    if data.get('sorted_idx') is not None:
+        training_data.sorted_idx = get_sorted_idx_of_sample(data['sorted_idx'], counts)
+    if data.get('codes') is not None:
+        training_data.histogram = Histogram(np.asarray(data['codes'][rows]), data['bin_edges'],
+                                            data['num_bins'])
+    if decision_tree.partition_in_place or decision_tree.compact_ids:
+        training_data.partition_in_place()
+
+    decision_tree._fit_training_data(training_data, splitter)
+    decision_tree.compile()
+
+    oob_rows = np.flatnonzero(counts == 0)
+    oob_values = decision_tree.tree.values[decision_tree.pred_str][
+        decision_tree.tree.apply(np.asarray(X[oob_rows]))]
+
+    return decision_tree, oob_rows, oob_values
+
+
+def _init_worker(path, data):
+    global _worker_data
+    _worker_data = dict(data)
+    for name in _SHARED_ARRAYS:
+        file_name = os.path.join(path, name + '.npy')
+        if os.path.exists(file_name):
+            _worker_data[name] = np.load(file_name, mmap_mode='r')
+
+
+def _fit_tree_in_worker(args):
+    return _fit_tree(_worker_data, *args)
+
+
+class RandomForest(object):
+    """
+    Bagged DecisionTrees, each grown on a bootstrap sample of the training data. Together with
+    a splitter that searches a random subset of features (see Splitter(max_features=...)),
+    this is a random forest.
+    """
+    def __init__(self, n_estimators=10, bootstrap=True, n_jobs=1, random_state=None,
+                 **tree_params):
+        """
+        :param n_estimators: number of trees
+        :param bootstrap: if False, every tree is grown on all rows
+        :param n_jobs: number of processes that grow trees in parallel, or -1 for one per
+                       CPU. The training data are presorted or binned once and shared with
+                       the processes as memory-mapped files instead of being pickled for
+                       every tree. The forest is the same as with a single process.
+        :param random_state: None, an int seed, or a numpy RandomState object
+        :param tree_params: parameters of every DecisionTree, e.g., node_class, max_depth,
+                            min_samples_leaf, presort or max_bins
+        """
+        self.n_estimators = n_estimators
+        self.bootstrap = bootstrap
+        self.n_jobs = n_jobs
+        self.random_state = (random_state if isinstance(random_state, np.random.RandomState)
+                             else np.random.RandomState(random_state))
+        self.tree_params = tree_params
+
+        # These are initialized by .fit()
+        self.pred_str = None
+        self.trees = None
+        self.X_names = None
+        self.Y_names = None
+        self.oob_prediction = None
+        self.oob_error = None
+
+        # All trees in one CompiledTree, and the node ID of the root of each tree:
+        self._tree = None
+        self._root_ids = None
+
+    def _fit_in_workers(self, data, tasks):
+        path = tempfile.mkdtemp()
+        try:
+            for name in _SHARED_ARRAYS:
+                if data.get(name) is not None:
+                    np.save(os.path.join(path, name + '.npy'), data[name])
+            small_data = {key: value for key, value in data.items() if key not in _SHARED_ARRAYS}
+
+            pool = multiprocessing.Pool(get_num_jobs(self.n_jobs), initializer=_init_worker,
+                                        initargs=(path, small_data))
+            try:
+                return pool.map(_fit_tree_in_worker, tasks)
+            finally:
+                pool.terminate()
+        finally:
+            shutil.rmtree(path)
+
+    def fit(self, X, Y, splitter=None):
+        """
+        Grows the trees and computes the out-of-bag predictions and error from the rows that
+        each tree did not see:
+
+            oob_prediction: numpy matrix of predictions combined like .predict() over the
+                            trees whose sample did not include the row, or NaN if there is
+                            no such tree
+            oob_error: mean absolute error of oob_prediction if pred_str is 'median', mean
+                       squared error otherwise, over the rows that have a prediction
+
+        :param X: DataFrame or numpy matrix of features
+        :param Y: DataFrame, Series or numpy array of targets
+        :param splitter: a Splitter object; MSESplitter by default
+        """
+        assert not sparse.issparse(X), 'RandomForest does not support sparse X.'
+
+        training_data = TrainingData(X, Y)
+        splitter = MSESplitter() if splitter is None else splitter
+        self.X_names = training_data.X_names
+        self.Y_names = training_data.Y_names
+        self.pred_str = splitter.pred_str
+
+        # Presorting and binning are done once here instead of for every tree:
+        decision_tree = DecisionTree(**self.tree_params)
+        data = {'X': training_data.X, 'Y': training_data.Y,
+                'feature_types': training_data.feature_types}
+        if decision_tree.presort:
+            training_data.presort()
+            data['sorted_idx'] = training_data.sorted_idx
+        if decision_tree.max_bins is not None:
+            training_data.bin(decision_tree.max_bins)
+            data['codes'] = training_data.histogram.codes
+            data['bin_edges'] = training_data.histogram.bin_edges
+            data['num_bins'] = training_data.histogram.num_bins
+
+        seeds = self.random_state.randint(np.iinfo(np.int32).max, size=self.n_estimators)
+        tasks = [(decision_tree, splitter, seed, self.bootstrap) for seed in seeds]
+        if get_num_jobs(self.n_jobs) <= 1:
+            results = [_fit_tree(data, *task) for task in tasks]
+        else:
+            results = self._fit_in_workers(data, tasks)
+
+        self.trees = [tree for tree, _, _ in results]
+        for tree in self.trees:
+            tree.X_names, tree.Y_names = self.X_names, self.Y_names
+        self._tree, self._root_ids = CompiledTree.concatenate([tree.tree for tree in self.trees])
+
+        reduce_values, reduce_missing_values = _REDUCERS.get(self.pred_str, _DEFAULT_REDUCERS)
+        oob_values = np.full((self.n_estimators, ) + training_data.Y.shape, np.nan)
+        for idx, (_, oob_rows, values) in enumerate(results):
+            oob_values[idx, oob_rows] = values
+
+        has_oob = ~np.isnan(oob_values[:, :, 0]).all(axis=0)
+        self.oob_prediction = np.full(training_data.Y.shape, np.nan)
+        self.oob_prediction[has_oob] = reduce_missing_values(oob_values[:, has_oob], axis=0)
+
+        errors = self.oob_prediction[has_oob] - training_data.Y[has_oob]
+        if not has_oob.any():
+            self.oob_error = np.nan
+        elif self.pred_str == 'median':
+            self.oob_error = np.mean(np.abs(errors))
+        else:
+            self.oob_error = np.mean(np.square(errors))
+
+    def apply(self, X):
+        """
+        :param X: DataFrame or numpy matrix of features
+        :return: a numpy matrix with the ID of the leaf each row falls into in every tree,
+                 one column per tree. IDs are those of the compiled trees in .trees.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.iloc[:, get_column_positions(self.X_names, X.columns)].values
+
+        return self._apply(X) - self._root_ids
+
+    def _apply(self, X):
+        # All trees route all rows together, one level at a time:
+        num_rows = X.shape[0]
+        leaf_ids = self._tree.route(X, np.tile(np.arange(num_rows), len(self.trees)),
+                                    np.repeat(self._root_ids, num_rows))
+
+        return leaf_ids.reshape(len(self.trees), num_rows).T
+
+    def predict(self, X, pred_str=None):
+        """
+        Combines the node values of the leaves that a row falls into: the median over the
+        trees for 'median', and the mean for any other pred_str. Memory use is proportional
+        to the number of rows times the number of trees.
+
+        :param X: DataFrame or numpy matrix of features
+        :param pred_str: name of the node value to predict; the splitter's default if None
+        :return: a DataFrame with columns Y_names and the index of X if X is a DataFrame,
+                 otherwise a numpy array
+        """
+        pred_str = pred_str or self.pred_str
+        reduce_values, _ = _REDUCERS.get(pred_str, _DEFAULT_REDUCERS)
+
+        X_np = (X.iloc[:, get_column_positions(self.X_names, X.columns)].values
+                if isinstance(X, pd.DataFrame) else X)
+        # Values of the leaves with one row per tree:
+        values = self._tree.values[pred_str][self._apply(X_np).T]
+        predicted = reduce_values(values, axis=0)
+
+        if isinstance(X, pd.DataFrame):
+            return pd.DataFrame(predicted, columns=self.Y_names, index=X.index)
+        else:
+            return predicted
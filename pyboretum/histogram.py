@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+
+import numpy as np
+
+# Maximum number of elements in the temporary arrays of Histogram.get_stats():
+_MAX_CHUNK_ELEMENTS = 2 ** 20
+
+
+def get_bin_edges(feature, max_bins):
+    """
+    Cut values that quantize a feature into at most max_bins bins. If the feature has no more
+    distinct values than max_bins, every value gets its own bin and the edges are the
+    midpoints between them, i.e., the same cutpoints an exact search considers. Otherwise,
+    the edges are quantiles of the feature.
+
+    :param feature: numpy array
+    :param max_bins: int
+    :return: a sorted numpy array of at most (max_bins - 1) edges
+    """
+    values = np.unique(feature)
+    if len(values) <= max_bins:
+        return (values[:-1] + values[1:]) / 2.
+    else:
+        quantiles = np.linspace(0, 100, max_bins + 1)[1:-1]
+        return np.unique(np.percentile(feature, quantiles))
+
+
+class Histogram(object):
+    """
+    Features quantized into bins with the following attributes:
+
+        codes: numpy matrix of bin codes (uint8 or uint16), one column per feature
+        bin_edges: list of numpy arrays, one per feature. A code c in column j means
+                   bin_edges[j][c - 1] < x <= bin_edges[j][c].
+
+    A cut after bin c of feature j is therefore the same as the cut x <= bin_edges[j][c].
+    Per-bin statistics of Y are computed on demand by .get_stats() and derived by subtraction
+    for the larger child when the histogram is partitioned.
+    """
+    def __init__(self, codes, bin_edges, num_bins):
+        self.codes = codes
+        self.bin_edges = bin_edges
+        self.num_bins = num_bins
+
+        # (counts, sums) computed by .get_stats():
+        self._stats = None
+
+    @classmethod
+    def from_features(cls, X, max_bins):
+        """
+        :param X: numpy matrix of features
+        :param max_bins: maximum number of bins for each feature (at most 2^16)
+        :return: a Histogram object
+        """
+        assert 2 <= max_bins <= np.iinfo(np.uint16).max + 1, \
+            'max_bins should be between 2 and {}.'.format(np.iinfo(np.uint16).max + 1)
+
+        dtype = np.uint8 if max_bins <= np.iinfo(np.uint8).max + 1 else np.uint16
+        bin_edges = [get_bin_edges(X[:, idx], max_bins) for idx in range(X.shape[1])]
+        codes = np.empty(X.shape, dtype=dtype)
+        for idx, edges in enumerate(bin_edges):
+            codes[:, idx] = np.searchsorted(edges, X[:, idx], side='left')
+
+        num_bins = max([len(edges) for edges in bin_edges] or [0]) + 1
+
+        return cls(codes, bin_edges, num_bins)
+
+    def get_stats(self, Y):
+        """
+        :param Y: numpy matrix of targets for the rows in the histogram
+        :return: a tuple of (counts, sums) where counts[j, c] is the number of rows in bin c of
+                 feature j and sums[j, c] is the sum of their rows of Y
+        """
+        if self._stats is None:
+            num_samples, num_features = self.codes.shape
+            counts = np.empty((num_features, self.num_bins), dtype=np.intp)
+            sums = np.empty((num_features, self.num_bins, Y.shape[1]))
+
+            # Features are counted in chunks with one bincount() call per chunk. The chunks
+            # keep the temporary arrays small for wide data.
+            chunk_size = max(1, _MAX_CHUNK_ELEMENTS // max(1, num_samples))
+            for begin in range(0, num_features, chunk_size):
+                end = min(begin + chunk_size, num_features)
+                size = (end - begin) * self.num_bins
+                flat_bins = (self.codes[:, begin:end].astype(np.intp) +
+                             np.arange(end - begin) * self.num_bins).ravel()
+
+                counts[begin:end] = np.bincount(flat_bins, minlength=size).reshape(-1, self.num_bins)
+                for k in range(Y.shape[1]):
+                    sums[begin:end, :, k] = np.bincount(flat_bins,
+                                                        weights=np.repeat(Y[:, k], end - begin),
+                                                        minlength=size).reshape(-1, self.num_bins)
+
+            self._stats = counts, sums
+
+        return self._stats
+
+    def _derive_stats(self, left, right, left_Y, right_Y):
+        if self._stats is not None:
+            # Only the smaller child is counted; the larger one is the parent minus its sibling:
+            if left.codes.shape[0] <= right.codes.shape[0]:
+                smaller, larger, smaller_Y = left, right, left_Y
+            else:
+                smaller, larger, smaller_Y = right, left, right_Y
+
+            counts, sums = self._stats
+            smaller_counts, smaller_sums = smaller.get_stats(smaller_Y)
+            larger._stats = counts - smaller_counts, sums - smaller_sums
+
+    def partition(self, mask, Y):
+        """
+        :param mask: boolean numpy array of rows that go to the left
+        :param Y: numpy matrix of targets for the rows in the histogram
+        :return: a pair of Histogram objects for the left and right rows
+        """
+        left = Histogram(self.codes[mask, :], self.bin_edges, self.num_bins)
+        right = Histogram(self.codes[~mask, :], self.bin_edges, self.num_bins)
+        self._derive_stats(left, right, Y[mask, :], Y[~mask, :])
+
+        return left, right
+
+    def split(self, num_left, Y):
+        """
+        Same as .partition() for codes that are already ordered with the left rows first. The
+        children are views of the codes.
+
+        :param num_left: number of rows that go to the left
+        :param Y: numpy matrix of targets, ordered like the codes
+        """
+        left = Histogram(self.codes[:num_left, :], self.bin_edges, self.num_bins)
+        right = Histogram(self.codes[num_left:, :], self.bin_edges, self.num_bins)
+        self._derive_stats(left, right, Y[:num_left, :], Y[num_left:, :])
+
+        return left, right
@@ -1,7 +1,62 @@
 import numpy as np
+from scipy import sparse
 
+from pyboretum.utils import densify
 
-class Node(object):
+
+def get_orthogonal_feature(coeffs):
+    """
+    :param coeffs: numpy array or None
+    :return: the index of the feature if coeffs describes an axis-aligned cut, or None
+    """
+    if coeffs is None:
+        return None
+
+    nonzero = np.flatnonzero(coeffs)
+    if len(nonzero) == 1 and coeffs[nonzero[0]] == 1.0:
+        return nonzero[0]
+    else:
+        return None
+
+
+class IdRange(object):
+    """
+    IDs of the samples in a node stored as the range [begin, end) of a permutation of IDs that
+    all nodes of a tree share, instead of a copy per node. See DecisionTree(compact_ids=True).
+    """
+    __slots__ = ('permutation', 'begin', 'end')
+
+    def __init__(self, permutation, begin, end):
+        self.permutation = permutation
+        self.begin = begin
+        self.end = end
+
+    def get(self):
+        """
+        :return: a numpy array (a view of the permutation) of the IDs
+        """
+        return self.permutation[self.begin:self.end]
+
+
+class _NodeType(type):
+    """
+    Gives every Node class __slots__ for the attribute names in its Y_FUNS, so that nodes do
+    not need an instance dictionary.
+    """
+    def __new__(mcs, name, bases, namespace):
+        if '__slots__' not in namespace:
+            inherited = set()
+            for base in bases:
+                for cls in base.__mro__:
+                    inherited.update(cls.__dict__.get('__slots__', ()))
+
+            namespace['__slots__'] = tuple(sorted(key for key in namespace.get('Y_FUNS', {})
+                                                  if key not in inherited))
+
+        return super(_NodeType, mcs).__new__(mcs, name, bases, namespace)
+
+
+class Node(_NodeType('_NodeBase', (object, ), {'__slots__': ()})):
     # A dictionary of attribute names to functions that calculate values from Y. Override
     # this in the derived class.
     Y_FUNS = {}
@@ -9,7 +64,10 @@ class Node(object):
     # Save indices when creating a node object:
     SAVE_IDS = False
 
-    def __init__(self,  X, Y, coeffs, threshold, saved_ids=None):
+    # Values of Y_FUNS get their own slots in derived classes:
+    __slots__ = ('n_samples', 'coeffs', 'threshold', 'feature', '_saved_ids')
+
+    def __init__(self,  X, Y, coeffs, threshold, saved_ids=None, stats=None):
         """
         Our decision rule should look like
            h = coeff[0]*feature[0] + coeff[1]*feature[1] + ... + coeff[p]*feature[p] <= threshold
@@ -17,37 +75,87 @@ class Node(object):
         where h represents a hyperplane in p dimensions. For a general nonlinear cut, we should
         consider combinding this with kernel methods.
 
-        :param X, Y: numpy matrices
+        :param X, Y: numpy matrices; X can also be a scipy sparse matrix
         :param coeffs: numpy array or None
         :param threshold: float or None
-        :param saved_ids: List of IDs
+        :param saved_ids: List of IDs, or an IdRange
+        :param stats: an optional dictionary from functions in Y_FUNS to their values over Y,
+                      which are used instead of computing them again
         """
-        self.__dict__.update({
-            'n_samples': len(X),
-            'coeffs': coeffs,
-            'threshold': threshold,
-        })
+        self._set('n_samples', X.shape[0])
+        self._set('coeffs', coeffs)
+        self._set('threshold', threshold)
+        # Axis-aligned cuts compare a single column instead of multiplying X by coeffs:
+        self._set('feature', get_orthogonal_feature(coeffs))
 
         if self.SAVE_IDS:
-            self.__dict__['saved_ids'] = saved_ids
+            self._set('_saved_ids', saved_ids)
 
         for key, fun in self.Y_FUNS.items():
-            self.__dict__[key] = fun(Y, axis=0)
+            if stats is not None and fun in stats:
+                self._set(key, stats[fun])
+            else:
+                self._set(key, fun(Y, axis=0))
+
+    def _set(self, key, value):
+        object.__setattr__(self, key, value)
 
     def __setattr__(self, key, value):
         raise AttributeError("can't set attribute")
 
-    def should_take_left(self, X):
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        for cls in type(self).__mro__:
+            for key in cls.__dict__.get('__slots__', ()):
+                if key != '__dict__' and hasattr(self, key):
+                    state[key] = getattr(self, key)
+
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            self._set(key, value)
+
+    @property
+    def saved_ids(self):
+        # This raises AttributeError like a missing attribute when IDs are not saved:
+        saved_ids = self._saved_ids
+        return saved_ids.get() if isinstance(saved_ids, IdRange) else saved_ids
+
+    def should_take_left(self, X, rows=None):
         """
         if feature is numeric: left means X feature value is <= node split value
                                right means X feature > node split
         if feature is boolean: left means X[node.feature] is False, right -> True
         if feature is category: left means X[node.feature] in node.threshold
 
-        :param X: numpy matrix
-        :return: Boolean numpy array
+        :param X: numpy matrix or scipy sparse matrix, or a numpy array for a single row
+        :param rows: optional numpy array of the rows of X to evaluate; all rows by default
+        :return: Boolean numpy array, or a Boolean for a single row
+        """
+        if self.feature is not None:
+            if X.ndim == 1:
+                return X[self.feature] <= self.threshold
+
+            column = X[:, self.feature] if rows is None else X[rows, self.feature]
+            return densify(column) <= self.threshold
+
+        if rows is not None:
+            X = X[rows, :]
+
+        if sparse.issparse(X):
+            return X.dot(self.coeffs) <= self.threshold
+        else:
+            return np.matmul(X, self.coeffs) <= self.threshold
+
+    def drop_cut(self):
+        """
+        Makes this node a leaf by removing its decision rule, e.g., when the tree stops
+        growing before the node is split.
         """
-        return np.matmul(X, self.coeffs) <= self.threshold
+        self._set('coeffs', None)
+        self._set('threshold', None)
+        self._set('feature', None)
 
     def is_leaf(self):
         return self.coeffs is None
@@ -2,3 +2,4 @@ from __future__ import absolute_import
 
 from .mae_splitter import MAESplitter
 from .mse_splitter import MSESplitter
+from .oblique_splitter import ObliqueMSESplitter
@@ -1,4 +1,18 @@
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
+from scipy import sparse
+
+from pyboretum.histogram import Histogram
+from pyboretum.utils import (
+    BINARY_FEATURE,
+    CONSTANT_FEATURE,
+    ORDERED_FEATURE,
+    densify,
+    get_feature_types,
+    get_num_jobs,
+    get_optional_kwargs,
+)
 
 
 def return_no_split():
@@ -12,7 +26,84 @@ def build_coeffs_for_orthogonal_cut(cut_idx, num_feature):
     return coeffs
 
 
+def _get_sample_size(max_size, size):
+    """
+    :param max_size: None, a number of items (int) or a fraction of them (float)
+    :param size: number of items
+    :return: the number of items to sample, between 1 and size
+    """
+    if max_size is None:
+        return size
+
+    num = int(max_size * size) if isinstance(max_size, float) else max_size
+    return min(size, max(1, num))
+
+
 class Splitter(object):
+    # Optional arguments of methods that derived classes override, e.g., child_stats, are only
+    # passed if they are set and the override accepts them, so that overrides with fewer
+    # arguments keep working (see pyboretum.utils.get_optional_kwargs()).
+
+    # Number of threads used to evaluate features. -1 means one per CPU.
+    n_jobs = 1
+
+    # Approximations of the search that are off by default (see __init__()):
+    max_features = None
+    max_samples = None
+    max_thresholds = None
+
+    def __init__(self, n_jobs=1, max_features=None, max_samples=None, max_thresholds=None,
+                 random_state=None):
+        """
+        :param n_jobs: number of threads used to evaluate features concurrently. The arrays
+                       are shared between threads, and the chosen cut is the same as with
+                       a single thread.
+        :param max_features: if given, only a random subset of this many features (int) or
+                             of this fraction of features (float) is searched at every node
+        :param max_samples: if given, cutpoints are searched on a random subsample of this
+                            many rows (int) or of this fraction of rows (float). The cost of
+                            the chosen cut is then computed again on all rows, and the cut is
+                            dropped if a child has fewer than min_samples_leaf rows. This does
+                            not apply to binned data, whose search does not depend on the
+                            number of rows.
+        :param max_thresholds: if given, ordered features are only cut at this many quantiles
+                               of the feature in nodes with more than 32 * max_thresholds rows
+                               (see ._get_quantile_cutpoint())
+        :param random_state: None, an int seed, or a numpy RandomState object used for
+                             sampling
+        """
+        self.n_jobs = n_jobs
+        self.max_features = max_features
+        self.max_samples = max_samples
+        self.max_thresholds = max_thresholds
+        self.random_state = (random_state if isinstance(random_state, np.random.RandomState)
+                             else np.random.RandomState(random_state))
+
+    def __del__(self):
+        pool = self.__dict__.get('_pool')
+        if pool is not None:
+            pool.terminate()
+
+    def __getstate__(self):
+        # Thread pools cannot be pickled:
+        state = self.__dict__.copy()
+        state.pop('_pool', None)
+        return state
+
+    def _map(self, fun, items):
+        """
+        Applies fun to every item, concurrently if n_jobs allows. The results are returned in
+        the order of items.
+        """
+        num_threads = get_num_jobs(self.n_jobs)
+        if num_threads <= 1 or len(items) <= 1:
+            return [fun(item) for item in items]
+
+        if getattr(self, '_pool', None) is None:
+            self._pool = ThreadPool(num_threads)
+
+        return self._pool.map(fun, items)
+
     @property
     def pred_str(self):
         """
@@ -20,55 +111,263 @@ class Splitter(object):
         """
         raise NotImplementedError()
 
-    def _get_binary_cutpoint(self, feature, Y, min_samples_leaf):
+    def get_node_cost(self, Y):
+        """
+        Cost of keeping all of Y in a single node, on the same scale as the cost of a cut
+        returned by .select_feature_to_cut(). This is used to rank nodes in best-first growth.
+        """
+        raise NotImplementedError()
+
+    def _get_binary_cutpoint(self, feature, Y, min_samples_leaf, child_stats=None):
         """
         Default implementation. Override this implementation for better performance.
         """
-        return self._get_ordered_cutpoint(feature, Y, min_samples_leaf)
+        return self._get_ordered_cutpoint(feature, Y, min_samples_leaf, **get_optional_kwargs(
+            self._get_ordered_cutpoint, child_stats=child_stats))
+
+    def _get_binary_cutpoints(self, X, Y, min_samples_leaf, child_stats=None):
+        """
+        Default implementation that cuts one binary feature at a time. Override this to cut
+        all of them at once for better performance.
+
+        :param X: numpy matrix of binary features
+        :param child_stats: None, or a list of dictionaries to fill, one per column of X (see
+                            ._get_ordered_cutpoint())
+        :return: a list of (cutpoint, cost) tuples, one per column of X
+        """
+        return [self._get_binary_cutpoint(densify(X[:, idx]), Y, min_samples_leaf,
+                                          **get_optional_kwargs(
+                                              self._get_binary_cutpoint,
+                                              child_stats=None if child_stats is None else child_stats[idx]))
+                for idx in range(X.shape[1])]
 
-    def _get_ordered_cutpoint(self, feature, Y, min_samples_leaf):
+    def _get_ordered_cutpoint(self, feature, Y, min_samples_leaf, sorted_idx=None,
+                              child_stats=None):
+        """
+        :param sorted_idx: positions that sort feature, if already known. The implementation
+                           should sort feature itself when this is None.
+        :param child_stats: None, or a dictionary that the implementation may fill with
+                            statistics of Y in the children it already knows, so that nodes do
+                            not compute them again. When a cut is found, child_stats['left']
+                            and child_stats['right'] are dictionaries from functions in
+                            Node.Y_FUNS, e.g., np.mean, to their values over each child.
+        """
         raise NotImplementedError()
 
     def _get_unordered_cutpoint(self, feature, Y, min_samples_leaf):
         raise NotImplementedError()
 
-    def get_best_cutpoint(self, feature, Y, min_samples_leaf, **kwargs):
+    def _get_histogram_cutpoint(self, histogram, feature_idx, Y, min_samples_leaf,
+                                child_stats=None):
+        """
+        Default implementation that runs the ordered search on bin codes, so that all rows in
+        a bin move together. Override this to search from per-bin statistics instead.
+
+        :param histogram: a Histogram object
+        :param feature_idx: the column of the feature in the histogram
+        """
+        codes = histogram.codes[:, feature_idx].astype(np.intp)
+        cutpoint, cost = self._get_ordered_cutpoint(codes, Y, min_samples_leaf, **get_optional_kwargs(
+            self._get_ordered_cutpoint, sorted_idx=np.argsort(codes, kind='mergesort'),
+            child_stats=child_stats))
+        if cutpoint is None:
+            return cutpoint, cost
+        else:
+            # The cutpoint falls between two codes; cutting after the lower one is equivalent:
+            return histogram.bin_edges[feature_idx][int(cutpoint)], cost
+
+    def _get_sparse_cutpoint(self, X, feature_idx, Y, min_samples_leaf, child_stats=None):
+        """
+        Default implementation that runs the ordered search on the densified column. Only the
+        nonzero values are sorted; the zeros are placed between the negative and positive
+        values in the order of rows, as a stable sort would. Override this to treat the
+        zeros as a single block instead.
+
+        :param X: scipy CSC matrix with sorted indices
+        :param feature_idx: the column of the feature in X
+        """
+        begin, end = X.indptr[feature_idx], X.indptr[feature_idx + 1]
+        rows, values = X.indices[begin:end], X.data[begin:end]
+
+        order = np.argsort(values, kind='mergesort')
+        rows, values = rows[order], values[order]
+
+        feature = np.zeros(X.shape[0])
+        feature[rows] = values
+        is_zero = feature == 0
+        sorted_idx = np.concatenate([rows[values < 0], np.flatnonzero(is_zero), rows[values > 0]])
+
+        return self._get_ordered_cutpoint(feature, Y, min_samples_leaf, **get_optional_kwargs(
+            self._get_ordered_cutpoint, sorted_idx=sorted_idx, child_stats=child_stats))
+
+    def _get_quantile_edges(self, feature):
+        """
+        :return: a sorted numpy array of at most max_thresholds quantiles of feature, which
+                 are estimated from about 32 * max_thresholds evenly spaced rows
+        """
+        step = max(1, feature.shape[0] // (32 * self.max_thresholds))
+        quantiles = np.linspace(0, 100, self.max_thresholds + 2)[1:-1]
+
+        return np.unique(np.percentile(feature[::step], quantiles))
+
+    def _get_quantile_cutpoint(self, feature, Y, min_samples_leaf, child_stats=None):
+        """
+        Searches only the cuts x <= edge at the edges from ._get_quantile_edges(). Rows
+        between consecutive edges are binned together and searched by
+        ._get_histogram_cutpoint(), which avoids sorting the feature.
+        """
+        edges = self._get_quantile_edges(feature)
+
+        # The code of a value is the number of edges below it, as in Histogram. Comparing
+        # with a few edges at a time is faster than np.searchsorted() on unsorted values:
+        codes = np.zeros(feature.shape[0], dtype=np.intp)
+        for edge in edges:
+            codes += feature > edge
+        histogram = Histogram(codes.reshape(-1, 1), [edges], len(edges) + 1)
+
+        return self._get_histogram_cutpoint(histogram, 0, Y, min_samples_leaf,
+                                            child_stats=child_stats)
+
+    def get_best_cutpoint(self, feature, Y, min_samples_leaf, feature_type=None, child_stats=None,
+                          **kwargs):
         """
         :param X: dataframe of feature
         :param y: column name of feature we are trying to predict
-        optional kwargs: min_samples_leaf, min_reduction
+        :param feature_type: type of the feature (see pyboretum.utils.get_feature_types()). It
+                             is detected from the feature if not given.
+        :param child_stats: None, or a dictionary to fill with statistics of the children (see
+                            ._get_ordered_cutpoint())
+        optional kwargs: min_samples_leaf, min_reduction, sorted_idx
         :return:
         """
+        if feature_type is None:
+            feature_type = get_feature_types(feature.reshape(-1, 1))[0]
 
-        # Is feature just binary indicator
-        if (feature == 0).all():
-            # Constant feature:
+        if feature_type == CONSTANT_FEATURE:
             best_cutpoint, cost = return_no_split()
 
-        elif ((feature == 0) | (feature == 1)).all():
-            best_cutpoint, cost = self._get_binary_cutpoint(feature, Y, min_samples_leaf)
+        elif feature_type == BINARY_FEATURE:
+            best_cutpoint, cost = self._get_binary_cutpoint(feature, Y, min_samples_leaf,
+                                                            **get_optional_kwargs(
+                                                                self._get_binary_cutpoint,
+                                                                child_stats=child_stats))
+
+        elif self.max_thresholds is not None and feature.shape[0] > 32 * self.max_thresholds:
+            # Small nodes are searched exactly since sorting them is cheap:
+            best_cutpoint, cost = self._get_quantile_cutpoint(feature, Y, min_samples_leaf,
+                                                              child_stats=child_stats)
 
         else:
             # TODO: we have to think about how to work with nominal values.
-            best_cutpoint, cost = self._get_ordered_cutpoint(feature, Y, min_samples_leaf)
+            best_cutpoint, cost = self._get_ordered_cutpoint(feature, Y, min_samples_leaf,
+                                                             **get_optional_kwargs(
+                                                                 self._get_ordered_cutpoint,
+                                                                 child_stats=child_stats, **kwargs))
 
         return best_cutpoint, cost
 
-    def select_feature_to_cut(self, X, Y, min_samples_leaf):
+    def select_feature_to_cut(self, X, Y, min_samples_leaf, sorted_idx=None, histogram=None,
+                              feature_types=None, child_stats=None):
         """
         This is a default implementation where the feature that gives the biggest gain when cut
         is chosen as the feature to cut.
 
+        X can also be a scipy sparse matrix, in which case ordered features are cut by
+        ._get_sparse_cutpoint() without densifying X. Presorting and binning are not supported
+        for sparse X.
+
         :param training_data: TrainingData object
         :param min_samples_leaf:
+        :param sorted_idx: an optional matrix whose columns are the positions that sort the
+                           corresponding columns of X (see TrainingData.presort())
+        :param histogram: an optional Histogram of X. If given, cuts are only searched between
+                          bins (see TrainingData.bin())
+        :param feature_types: an optional numpy array with the type of each column of X (see
+                              pyboretum.utils.get_feature_types()). Binary features are then
+                              cut together by ._get_binary_cutpoints().
+        :param child_stats: None, or a dictionary that is filled with the statistics of Y in
+                            the children of the chosen cut that the search already knows (see
+                            ._get_ordered_cutpoint()). It is left empty otherwise.
         :return: a tuple of (feature, cutpoint, cost). The cutpoint and cost can be None, and
                  float(inf), respectively, if the variable selection algorithm does not cut as well.
         """
+        is_sparse = sparse.issparse(X)
+        if is_sparse:
+            assert sorted_idx is None and histogram is None, \
+                'sorted_idx and histogram are not supported for sparse X.'
+            X = X.tocsc()
+            if not X.has_sorted_indices:
+                X = X.sorted_indices()
+            if feature_types is None:
+                feature_types = get_feature_types(X)
+
+        num_samples, num_features = X.shape
+        all_X, all_Y = X, Y
+
+        # Only a random subset of features is searched with max_features:
+        features = np.arange(num_features)
+        num_searched = _get_sample_size(self.max_features, num_features)
+        if num_searched < num_features:
+            features = np.sort(self.random_state.choice(num_features, num_searched, replace=False))
+
+        # Cutpoints are searched on a random subsample of rows with max_samples:
+        num_subsampled = _get_sample_size(self.max_samples, num_samples)
+        is_subsampled = histogram is None and num_subsampled < num_samples
+        search_min_samples_leaf = min_samples_leaf
+        if is_subsampled:
+            rows = np.sort(self.random_state.choice(num_samples, num_subsampled, replace=False))
+            X, Y = X[rows], Y[rows]
+            if is_sparse and not X.has_sorted_indices:
+                X = X.sorted_indices()
+            sorted_idx = None
+            search_min_samples_leaf = max(1, int(round(min_samples_leaf * num_subsampled /
+                                                       float(num_samples))))
+
+        # Each feature fills its own dictionary so that threads do not share one. Statistics
+        # of a subsample are not those of all rows, so they are not collected:
+        collects_stats = child_stats is not None and not is_subsampled
+        feature_stats = [{} if collects_stats else None for _ in range(num_features)]
+
+        def get_cutpoint(idx):
+            if is_sparse:
+                return self._get_sparse_cutpoint(X, idx, Y, search_min_samples_leaf,
+                                                 child_stats=feature_stats[idx])
+            elif histogram is not None:
+                return self._get_histogram_cutpoint(histogram, idx, Y, search_min_samples_leaf,
+                                                    child_stats=feature_stats[idx])
+            else:
+                kwargs = get_optional_kwargs(
+                    self.get_best_cutpoint,
+                    sorted_idx=None if sorted_idx is None else sorted_idx[:, idx],
+                    feature_type=None if feature_types is None else feature_types[idx],
+                    child_stats=feature_stats[idx])
+                return self.get_best_cutpoint(X[:, idx], Y, search_min_samples_leaf, **kwargs)
+
+        results = [return_no_split()] * num_features
+        if histogram is None and feature_types is not None:
+            searched_types = feature_types[features]
+
+            binary_idx = features[searched_types == BINARY_FEATURE]
+            if len(binary_idx) > 0:
+                binary_results = self._get_binary_cutpoints(
+                    X[:, binary_idx], Y, search_min_samples_leaf,
+                    child_stats=[feature_stats[idx] for idx in binary_idx] if collects_stats else None)
+                for idx, result in zip(binary_idx, binary_results):
+                    results[idx] = result
+
+            ordered_idx = features[searched_types == ORDERED_FEATURE].tolist()
+            for idx, result in zip(ordered_idx, self._map(get_cutpoint, ordered_idx)):
+                results[idx] = result
+
+        else:
+            for idx, result in zip(features, self._map(get_cutpoint, features.tolist())):
+                results[idx] = result
+
+        # Reduce in the order of features so that ties are broken the same way regardless
+        # of n_jobs:
         best_idx = None
         best_cutpoint, best_cost = return_no_split()
-
-        for idx in range(X.shape[1]):
-            cutpoint, cost = self.get_best_cutpoint(X[:, idx], Y, min_samples_leaf)
+        for idx, (cutpoint, cost) in enumerate(results):
             if cutpoint is not None and cost < best_cost:
                 best_idx = idx
                 best_cutpoint, best_cost = cutpoint, cost
@@ -77,5 +376,18 @@ class Splitter(object):
             return None, best_cutpoint, best_cost
 
         else:
-            coeffs = build_coeffs_for_orthogonal_cut(best_idx, X.shape[1])
+            if is_subsampled:
+                # The cut is evaluated again on all rows:
+                mask = densify(all_X[:, best_idx]) <= best_cutpoint
+                num_left = np.count_nonzero(mask)
+                if min(num_left, num_samples - num_left) < min_samples_leaf:
+                    return (None, ) + return_no_split()
+
+                best_cost = (num_left * self.get_node_cost(all_Y[mask]) +
+                             (num_samples - num_left) * self.get_node_cost(all_Y[~mask])) / num_samples
+
+            elif collects_stats:
+                child_stats.update(feature_stats[best_idx])
+
+            coeffs = build_coeffs_for_orthogonal_cut(best_idx, num_features)
             return coeffs, best_cutpoint, best_cost
@@ -5,80 +5,367 @@ import numpy as np
 import operator
 from sortedcontainers import SortedList
 
+from pyboretum.utils import (
+    count_nonzero,
+    densify,
+)
 from .base import (
     Splitter,
     return_no_split,
 )
 
 
+def get_prefix_lower_sums(ranks, sorted_values, lengths, num_smallest):
+    """
+    For every query q, the sum of the num_smallest[q] smallest values among the first
+    lengths[q] values of a sequence. All queries walk down a wavelet matrix over the ranks
+    together, one bit of the ranks at a time, so the cost is O((n + q) * log(n)) in NumPy.
+
+    :param ranks: numpy array of the ranks of the values in sequence order; a permutation of
+                  0, ..., n - 1
+    :param sorted_values: numpy array of the values in ascending order, i.e., by rank
+    :param lengths: numpy array of prefix lengths
+    :param num_smallest: numpy array of the number of values to sum, at most lengths
+    :return: a numpy array of sums, one per query
+    """
+    current = np.asarray(ranks, dtype=np.intp)
+    lower = np.zeros(len(lengths), dtype=np.intp)
+    upper = np.asarray(lengths, dtype=np.intp)
+    remaining = np.array(num_smallest, dtype=np.intp)
+    rank_prefix = np.zeros(len(lengths), dtype=np.intp)
+    sums = np.zeros(len(lengths))
+
+    # Each query is the range [lower, upper) of the current level. The range shrinks to the
+    # values with the same bits as the remaining-th smallest value, and values with a 0 bit
+    # are summed whenever the query moves on to the values with a 1 bit:
+    for bit in reversed(range(max(1, int(len(current) - 1).bit_length()))):
+        is_zero = (current >> bit) & 1 == 0
+        zeros = np.concatenate(([0], np.cumsum(is_zero)))
+        zero_sums = np.concatenate(([0.], np.cumsum(np.where(is_zero, sorted_values[current], 0.))))
+
+        zeros_in_range = zeros[upper] - zeros[lower]
+        go_right = remaining > zeros_in_range
+        sums += np.where(go_right, zero_sums[upper] - zero_sums[lower], 0.)
+        remaining -= np.where(go_right, zeros_in_range, 0)
+        rank_prefix |= go_right.astype(np.intp) << bit
+
+        lower = np.where(go_right, zeros[-1] + lower - zeros[lower], zeros[lower])
+        upper = np.where(go_right, zeros[-1] + upper - zeros[upper], zeros[upper])
+        current = np.concatenate((current[is_zero], current[~is_zero]))
+
+    # Ranks are unique, so at most one value is left in every range:
+    return sums + remaining * sorted_values[rank_prefix]
+
+
+def get_prefix_sads(ranks, sorted_values):
+    """
+    :param ranks: numpy array of the ranks of the values in sequence order
+    :param sorted_values: numpy array of the values in ascending order
+    :return: a numpy array where element m is the sum of absolute deviations of the first m
+             values from their median, for m = 0, ..., n
+    """
+    lengths = np.arange(len(ranks) + 1)
+    half_sums = get_prefix_lower_sums(ranks, sorted_values, np.concatenate((lengths, lengths)),
+                                      np.concatenate(((lengths + 1) // 2, lengths // 2)))
+    upper_half, lower_half = half_sums[:len(lengths)], half_sums[len(lengths):]
+    totals = np.concatenate(([0.], np.cumsum(sorted_values[ranks])))
+
+    # The median is the ceil(m/2)-th smallest value, so the values up to it count negatively
+    # and the rest positively; the median itself cancels out for odd m:
+    return totals - upper_half - lower_half
+
+
+def get_cut_mae(feature, y, cutpoint, child_stats=None):
+    """
+    :param child_stats: None, or a dictionary to fill with the medians of the children (see
+                        Splitter._get_ordered_cutpoint())
+    :return: the mean absolute deviation of y from the median of its side of the cut
+    """
+    left_y = y[feature <= cutpoint]
+    right_y = y[feature > cutpoint]
+    left_median, right_median = np.median(left_y, axis=0), np.median(right_y, axis=0)
+    if child_stats is not None:
+        child_stats['left'] = {np.median: left_median}
+        child_stats['right'] = {np.median: right_median}
+
+    return (np.sum(np.abs(left_y - left_median)) + np.sum(np.abs(right_y - right_median))) / y.shape[0]
+
+
 class MAESplitter(Splitter):
-    def __init__(self, *args, **kwargs):
-        pass
+    def __init__(self, bulk=False, *args, **kwargs):
+        """
+        :param bulk: if True, the costs of all cuts of a feature are computed at once by
+                     .get_sad_curve() instead of a running median. This is faster on large
+                     nodes, but the sums are rounded differently, so cuts with (nearly) equal
+                     costs may be chosen differently.
+        """
+        super(MAESplitter, self).__init__(*args, **kwargs)
+        self.bulk = bulk
 
     @property
     def pred_str(self):
         return 'median'
 
-    def _get_binary_cutpoint(self, feature, y, min_samples_leaf):
+    def get_node_cost(self, y):
+        return np.sum(np.abs(y - np.median(y))) / y.shape[0]
+
+    def _get_quantile_cutpoint(self, feature, y, min_samples_leaf, child_stats=None):
+        # With only a few candidate cuts, computing the MAE of each one in O(n) is faster
+        # than a running median over all rows.
+        best_cutpoint, best_mae = return_no_split()
+        for edge in self._get_quantile_edges(feature):
+            num_left = np.count_nonzero(feature <= edge)
+            if min(num_left, y.shape[0] - num_left) >= min_samples_leaf:
+                mae = get_cut_mae(feature, y, edge)
+                if mae < best_mae:
+                    best_cutpoint, best_mae = edge, mae
+
+        if best_cutpoint is not None and child_stats is not None:
+            get_cut_mae(feature, y, best_cutpoint, child_stats)
+
+        return best_cutpoint, best_mae
+
+    def _get_binary_cutpoint(self, feature, y, min_samples_leaf, child_stats=None):
         """
         Lower-case y is used since MAE splitter only supports univariate decision trees.
         """
         best_cutpoint = .5
-        left_y = y[feature <= best_cutpoint]
-        right_y = y[feature > best_cutpoint]
-        if min(left_y.shape[0], right_y.shape[0]) >= min_samples_leaf:
-            mae = (np.sum(np.abs(left_y - np.median(left_y))) + np.sum(np.abs(right_y - np.median(right_y)))) / y.shape[0]
+        num_left = np.count_nonzero(feature <= best_cutpoint)
+        if min(num_left, y.shape[0] - num_left) >= min_samples_leaf:
+            mae = get_cut_mae(feature, y, best_cutpoint, child_stats)
         else:
             best_cutpoint, mae = return_no_split()
 
         return best_cutpoint, mae
 
-    def _get_ordered_cutpoint(self, feature, y, min_samples_leaf):
+    def _get_binary_cutpoints(self, X, y, min_samples_leaf, child_stats=None):
+        # Features with too few zeros or ones are skipped based on counts from a single pass:
+        num_ones = count_nonzero(X)
+        is_valid = np.minimum(num_ones, y.shape[0] - num_ones) >= min_samples_leaf
+
+        return [self._get_binary_cutpoint(densify(X[:, idx]), y, min_samples_leaf,
+                                          None if child_stats is None else child_stats[idx])
+                if is_valid[idx] else return_no_split() for idx in range(X.shape[1])]
+
+    def get_sad_curve(self, feature, y, sorted_idx=None):
+        """
+        :param feature: numpy array
+        :param y: numpy matrix with a single column
+        :param sorted_idx: positions that sort feature, if already known
+        :return: a numpy array where element i is the total sum of absolute deviations from the
+                 medians when the first (i + 1) rows in the order of feature go to the left
+                 and the rest to the right, for i = 0, ..., n - 2. Only positions between
+                 distinct feature values are valid cuts.
+        """
+        if sorted_idx is None:
+            sorted_idx = np.argsort(feature)
+        y_values = np.ravel(y[sorted_idx])
+
+        y_order = np.argsort(y_values, kind='mergesort')
+        ranks = np.empty(len(y_order), dtype=np.intp)
+        ranks[y_order] = np.arange(len(y_order))
+        sorted_values = y_values[y_order]
+
+        left_sads = get_prefix_sads(ranks, sorted_values)
+        right_sads = get_prefix_sads(ranks[::-1], sorted_values)
+
+        return left_sads[1:-1] + right_sads[-2:0:-1]
+
+    def _get_bulk_cutpoint(self, feature, y, min_samples_leaf, sorted_idx):
+        sad_curve = self.get_sad_curve(feature, y, sorted_idx=sorted_idx)
+
+        feature = feature[sorted_idx]
+        num_left = np.arange(1, len(feature))
+        is_valid = ((feature[1:] > feature[:-1]) &
+                    (np.minimum(num_left, len(feature) - num_left) >= min_samples_leaf))
+        if not is_valid.any():
+            return None
+
+        i = np.flatnonzero(is_valid)[np.argmin(sad_curve[is_valid])]
+        return (feature[i + 1] + feature[i]) / 2.
+
+    def _get_ordered_cutpoint(self, feature, y, min_samples_leaf, sorted_idx=None,
+                              child_stats=None):
         """
         Lower-case y is used since MAE splitter only supports univariate decision trees.
         """
-        sorted_idx = np.argsort(feature)
+        if sorted_idx is None:
+            sorted_idx = np.argsort(feature)
+
+        if self.bulk:
+            best_cutpoint = self._get_bulk_cutpoint(feature, y, min_samples_leaf, sorted_idx)
+            if best_cutpoint is None:
+                return return_no_split()
+            mae = get_cut_mae(feature, y, best_cutpoint, child_stats)
+
+            return best_cutpoint, mae
+
         feature = feature[sorted_idx]
         y = y[sorted_idx]
 
-        right = MAE_AVL(y)
+        # Ranks of y are computed once, and values move between the two sides by rank. Ties
+        # in y are broken by position, so every rank is unique.
+        y_values = np.ravel(y)
+        y_order = np.argsort(y_values, kind='mergesort')
+        ranks = np.empty(len(y_order), dtype=np.intp)
+        ranks[y_order] = np.arange(len(y_order))
+        ranks = ranks.tolist()
+        sorted_values = y_values[y_order].tolist()
+
+        right = MAE_BIT(sorted_values, ranks)
         left = None
 
         # The overall complexity of the following loop is O(n*log(n)) where n is the number of
-        # samples, as long as the cost of insertion and deletion into the MAE_AVL is O(log(n)).
-        points_to_move = []
+        # samples since every update of MAE_BIT is O(log(n)) per value.
         best_split_value = float('inf')
         best_cutpoint, mae = return_no_split()
-        for i in range(len(feature) - 1):
-            points_to_move.append(y[i])
-            if feature[i+1] > feature[i]:
-                if left is None:
-                    left = MAE_AVL(points_to_move)
-                else:
-                    left.add(points_to_move)
-                right.remove(points_to_move)
+        begin = 0
+        for i in np.flatnonzero(feature[1:] > feature[:-1]).tolist():
+            # Move the group of tied feature values ending at i to the left:
+            points_to_move = ranks[begin:(i + 1)]
+            if left is None:
+                left = MAE_BIT(sorted_values, points_to_move)
+            else:
+                left.add(points_to_move)
+            right.remove(points_to_move)
+            begin = i + 1
 
-                left_sad = (left.greater_than_sum - left.less_than_sum +
-                            left.median * (left.less_than_items - left.greater_than_items))
+            new_split_value = right.get_sad() + left.get_sad()
+            if (new_split_value < best_split_value and
+                    min(i + 1, len(feature) - (i + 1)) >= min_samples_leaf):
+                best_split_value = new_split_value
+                best_cutpoint = (feature[i + 1] + feature[i]) / 2.
 
-                right_sad = (right.greater_than_sum - right.less_than_sum +
-                             right.median * (right.less_than_items - right.greater_than_items))
+        if best_cutpoint is not None:
+            mae = get_cut_mae(feature, y, best_cutpoint, child_stats)
 
-                new_split_value = right_sad + left_sad
+        return best_cutpoint, mae
 
-                if (new_split_value < best_split_value and
-                            min(i+1, len(feature)-(i+1)) >= min_samples_leaf):
-                    best_split_value = new_split_value
-                    best_cutpoint = (feature[i+1] + feature[i]) / 2.
 
-                points_to_move = []
+class MAE_BIT(object):
+    """
+    A replacement of MAE_AVL that keeps the subset of values in a binary indexed (Fenwick) tree
+    of counts over the ranks of all values. Finding the k-th smallest value, adding and
+    removing are O(log(n)) on a flat list, without creating an object per value.
 
-        if best_cutpoint is not None:
-            left_y = y[feature <= best_cutpoint]
-            right_y = y[feature > best_cutpoint]
-            mae = (np.sum(np.abs(left_y - np.median(left_y))) + np.sum(np.abs(right_y - np.median(right_y)))) / y.shape[0]
+    The sums are updated in exactly the same order as MAE_AVL, so both give identical
+    results, including the rounding errors that decide between tied cutpoints.
+    """
+    def __init__(self, sorted_values, ranks):
+        """
+        :param sorted_values: list of all values in ascending order; values are referred to by
+                              their position (rank) in this list
+        :param ranks: ranks of the values in the initial subset
+        """
+        self._values = sorted_values
+        self._size = len(sorted_values)
+        self._counts = [0] * (self._size + 1)
 
-        return best_cutpoint, mae
+        # Largest power of two not exceeding the size, where the search for ranks starts:
+        self._top_step = 1 << (self._size.bit_length() - 1) if self._size > 0 else 0
+
+        ranks = sorted(ranks)
+        if len(ranks) == self._size:
+            # Linear-time construction when all values are present:
+            for position in range(1, self._size + 1):
+                self._counts[position] += 1
+                parent = position + (position & -position)
+                if parent <= self._size:
+                    self._counts[parent] += self._counts[position]
+        else:
+            for rank in ranks:
+                self._increment(rank, 1)
+
+        values = [sorted_values[rank] for rank in ranks]
+        idx = int(math.ceil(len(values) / 2.))
+        self.less_than_sum = sum(values[:idx])
+        self.less_than_items = idx
+        self.greater_than_sum = sum(values[idx:])
+        self.greater_than_items = len(values) - idx
+        self._update_median()
+
+    def _increment(self, rank, count):
+        counts, size = self._counts, self._size
+        position = rank + 1
+        while position <= size:
+            counts[position] += count
+            position += position & -position
+
+    def _get_kth_value(self, k):
+        """
+        :param k: 1-based order of the value in the subset
+        """
+        counts, size = self._counts, self._size
+        position = 0
+        step = self._top_step
+        while step > 0:
+            next_position = position + step
+            if next_position <= size and counts[next_position] < k:
+                position = next_position
+                k -= counts[position]
+            step >>= 1
+
+        return self._values[position]
+
+    def _update_median(self):
+        # The largest value of the lower half is kept for the next update:
+        self._less_than_max = (self._get_kth_value(self.less_than_items)
+                               if self.less_than_items > 0 else None)
+        if self.less_than_items > self.greater_than_items:
+            self.median = self._less_than_max
+        else:
+            self.median = (self._less_than_max +
+                           self._get_kth_value(self.less_than_items + 1)) / 2.
+
+    def _update(self, ranks, sign):
+        # The lower half is always the less_than_items smallest values in the subset. Tied
+        # values may sit on either side, but their sums are the same.
+        # The largest value of the lower half only changes when a value is removed from it:
+        less_than_max = self._less_than_max
+        for rank in ranks:
+            value = self._values[rank]
+            if self.less_than_items > 0 and value <= less_than_max:
+                self.less_than_sum = self.less_than_sum + sign * value
+                self.less_than_items += sign
+                if sign < 0:
+                    self._increment(rank, sign)
+                    less_than_max = (self._get_kth_value(self.less_than_items)
+                                     if self.less_than_items > 0 else None)
+                    continue
+            else:
+                self.greater_than_sum = self.greater_than_sum + sign * value
+                self.greater_than_items += sign
+
+            self._increment(rank, sign)
+
+        while self.less_than_items > self.greater_than_items + 1:
+            x = self._get_kth_value(self.less_than_items)
+            self.less_than_sum -= x
+            self.greater_than_sum += x
+            self.less_than_items -= 1
+            self.greater_than_items += 1
+
+        while self.greater_than_items > self.less_than_items:
+            x = self._get_kth_value(self.less_than_items + 1)
+            self.less_than_sum += x
+            self.greater_than_sum -= x
+            self.less_than_items += 1
+            self.greater_than_items -= 1
+
+        self._update_median()
+
+    def remove(self, ranks):
+        self._update(ranks, -1)
+
+    def add(self, ranks):
+        self._update(ranks, 1)
+
+    def get_sad(self):
+        """
+        :return: the sum of absolute deviations of the subset from its median
+        """
+        return (self.greater_than_sum - self.less_than_sum +
+                self.median * (self.less_than_items - self.greater_than_items))
 
 
 class MAE_AVL(object):
@@ -1,18 +1,28 @@
 from __future__ import absolute_import
 
 import numpy as np
+from scipy import sparse
 
+from pyboretum.utils import count_nonzero
 from .base import (
     Splitter,
     return_no_split,
 )
 
 
+def _set_child_means(child_stats, left_means, right_means):
+    if child_stats is not None:
+        child_stats['left'] = {np.mean: left_means}
+        child_stats['right'] = {np.mean: right_means}
+
+
 class MSESplitter(Splitter):
     def __init__(self, covariance_matrix=None, *args, **kwargs):
         """
         :param covariance_matrix: an ndarray for covariance matrix
         """
+        super(MSESplitter, self).__init__(*args, **kwargs)
+
         if covariance_matrix is None:
             # This is set when .get_best_cutpoint() is called:
             self.inverse_covariance_matrix = None
@@ -32,15 +42,39 @@ class MSESplitter(Splitter):
         """
         return (errors * np.matmul(errors, self.inverse_covariance_matrix)).sum()
 
-    def _get_binary_cutpoint(self, feature, Y, min_samples_leaf):
+    def mahalanobis_distances(self, errors):
+        """
+        :param errors: an array of errors (x_t - mu) along its last axis, e.g., a matrix with
+                       one error per row
+        :return: an array of the mahalanobis distance of each error
+        """
+        return (errors * np.matmul(errors, self.inverse_covariance_matrix)).sum(axis=-1)
+
+    def get_node_cost(self, Y):
+        self._init_inverse_covariance_matrix(Y)
+
+        return self.mahalanobis_distance(Y - Y.mean(axis=0)) / Y.shape[0]
+
+    def _is_positive_gain(self, centered_gain, means, num_samples):
+        """
+        Searches rank cuts by gains computed from sums centered around the mean of Y. A cut is
+        used if its gain without centering would be positive, which adds the distance of
+        the mean to the centered gain, so that, e.g., cuts between equal nonzero targets are
+        still taken.
+        """
+        return centered_gain + num_samples * self.mahalanobis_distance(means) > 0.0
+
+    def _get_binary_cutpoint(self, feature, Y, min_samples_leaf, child_stats=None):
         # This is more efficient than _get_ordered_cutpoint() since there is no sort involved.
         # The computational complexity is just O(n) where n is the number of samples.
         best_cutpoint = .5
         left_y = Y[feature <= best_cutpoint]
         right_y = Y[feature > best_cutpoint]
         if min(left_y.shape[0], right_y.shape[0]) > min_samples_leaf:
-            left_errors = left_y - left_y.mean(axis=0)
-            right_errors = right_y - right_y.mean(axis=0)
+            left_means, right_means = left_y.mean(axis=0), right_y.mean(axis=0)
+            left_errors = left_y - left_means
+            right_errors = right_y - right_means
+            _set_child_means(child_stats, left_means, right_means)
             mse = (self.mahalanobis_distance(left_errors) +
                    self.mahalanobis_distance(right_errors)) / Y.shape[0]
         else:
@@ -48,29 +82,68 @@ class MSESplitter(Splitter):
 
         return best_cutpoint, mse
 
-    def _get_ordered_cutpoint(self, feature, Y, min_samples_leaf):
-        # The computational complexity is O(n*log(n)) determined by the sorting below.
-        sorted_idx = np.argsort(feature)
+    def _get_binary_cutpoints(self, X, Y, min_samples_leaf, child_stats=None):
+        # Every binary feature is cut from the number of ones and the sum of errors over them,
+        # which are computed for all features with a single matrix product.
+        self._init_inverse_covariance_matrix(Y)
+        errors = Y - Y.mean(axis=0)
+        Nr = count_nonzero(X)
+        Nl = Y.shape[0] - Nr
+        if sparse.issparse(X):
+            Sr = X.T.dot(errors)
+        else:
+            Sr = np.matmul(X.T.astype(float, copy=False), errors)
+        Sl = errors.sum(axis=0) - Sr
+
+        is_valid = np.minimum(Nl, Nr) > min_samples_leaf
+        gains = np.zeros(X.shape[1])
+        gains[is_valid] = ((self.mahalanobis_distances(Sl[is_valid]) / Nl[is_valid]) +
+                           (self.mahalanobis_distances(Sr[is_valid]) / Nr[is_valid]))
+        costs = (self.mahalanobis_distance(errors) - gains) / Y.shape[0]
+
+        if child_stats is not None:
+            means = Y.mean(axis=0)
+            for idx in np.flatnonzero(is_valid):
+                _set_child_means(child_stats[idx], means + Sl[idx] / Nl[idx],
+                                 means + Sr[idx] / Nr[idx])
+
+        return [(.5, cost) if valid else return_no_split() for valid, cost in zip(is_valid, costs)]
+
+    def _get_ordered_cutpoint(self, feature, Y, min_samples_leaf, sorted_idx=None,
+                              child_stats=None):
+        # The computational complexity is O(n*log(n)) determined by the sorting below, or O(n)
+        # if the data are presorted.
+        if sorted_idx is None:
+            sorted_idx = np.argsort(feature)
         feature = feature[sorted_idx]
         Y = Y[sorted_idx]
 
-        # See Torgo's thesis for more information about the implementation below.
-        Sr, Nr = Y.sum(axis=0), len(feature)
+        # See Torgo's thesis for more information about the implementation below. The sums
+        # on the left and right of every possible cut are evaluated at once with cumulative
+        # sums; the sums on the right are accumulated from the total in the same order as
+        # a sequential scan to keep the same rounding. Y is centered around its mean so that
+        # the sums do not lose the differences between cuts when Y has a large offset.
+        means = Y.mean(axis=0)
+        errors = Y - means
+        Sl = np.cumsum(errors[:-1], axis=0, dtype=float)
+        Sr = np.cumsum(np.vstack([errors.sum(axis=0), -errors[:-1]]), axis=0, dtype=float)[1:]
+        Nl = np.arange(1, feature.shape[0])
+        Nr = feature.shape[0] - Nl
+
+        # A cut can only be placed between distinct values:
+        is_valid = (feature[1:] > feature[:-1]) & (np.minimum(Nl, Nr) >= min_samples_leaf)
+
+        split_values = (self.mahalanobis_distances(Sl) / Nl) + \
+                       (self.mahalanobis_distances(Sr) / Nr)
+        split_values[~is_valid] = -np.inf
 
-        Sl, Nl = np.zeros(Y.shape[1]), 0
-        bestTillNow = 0.0
         best_cutpoint, mse = return_no_split()
-        for i in range(feature.shape[0] - 1):
-            Sl += Y[i]
-            Sr -= Y[i]
-            Nl += 1
-            Nr -= 1
-            if (feature[i + 1] > feature[i]) and (min(Nl, Nr) >= min_samples_leaf):
-                newSplitValue = (self.mahalanobis_distance(np.array([Sl])) / Nl) + \
-                                (self.mahalanobis_distance(np.array([Sr])) / Nr)
-                if newSplitValue > bestTillNow:
-                    bestTillNow = newSplitValue
-                    best_cutpoint = (feature[i] + feature[i + 1]) / 2.
+        if split_values.shape[0] > 0:
+            # argmax() returns the first of tied maxima like a sequential scan would:
+            i = np.argmax(split_values)
+            if is_valid[i] and self._is_positive_gain(split_values[i], means, Y.shape[0]):
+                best_cutpoint = (feature[i] + feature[i + 1]) / 2.
+                _set_child_means(child_stats, means + Sl[i] / Nl[i], means + Sr[i] / Nr[i])
 
         if best_cutpoint is not None:
             left_y = Y[feature <= best_cutpoint]
@@ -79,8 +152,100 @@ class MSESplitter(Splitter):
 
         return best_cutpoint, mse
 
-    def get_best_cutpoint(self, feature, Y, min_samples_leaf, **kwargs):
+    def _get_block_cutpoint(self, counts, sums, Y, can_cut, min_samples_leaf, child_stats=None):
+        """
+        Searches cuts between consecutive blocks of rows from the number of rows and the sum
+        of Y in every block.
+
+        :param counts: numpy array of the number of rows in each block
+        :param sums: numpy matrix of the sums of Y in each block, one row per block
+        :param can_cut: boolean numpy array, whether the cut right after each block but the
+                        last one is allowed
+        :return: a tuple of (position of the block right before the best cut, cost). The
+                 position is None if there is no cut.
+        """
+        # Sums are centered around the mean of Y, as in .get_node_cost(), so that the cost
+        # does not cancel out when Y has a large offset:
+        means = Y.mean(axis=0)
+        errors = Y - means
+        Nl = np.cumsum(counts)[:-1]
+        Nr = Y.shape[0] - Nl
+        Sl = np.cumsum(sums - np.outer(counts, means), axis=0)[:-1]
+        Sr = errors.sum(axis=0) - Sl
+
+        is_valid = can_cut & (Nl > 0) & (Nr > 0) & (np.minimum(Nl, Nr) >= min_samples_leaf)
+
+        split_values = np.full(Nl.shape[0], -np.inf)
+        split_values[is_valid] = ((self.mahalanobis_distances(Sl[is_valid]) / Nl[is_valid]) +
+                                  (self.mahalanobis_distances(Sr[is_valid]) / Nr[is_valid]))
+
+        if split_values.shape[0] > 0:
+            i = np.argmax(split_values)
+            if is_valid[i] and self._is_positive_gain(split_values[i], means, Y.shape[0]):
+                _set_child_means(child_stats, means + Sl[i] / Nl[i], means + Sr[i] / Nr[i])
+
+                # Sum of squared errors around the means of the children:
+                return i, (self.mahalanobis_distance(errors) - split_values[i]) / Y.shape[0]
+
+        return return_no_split()
+
+    def _get_histogram_cutpoint(self, histogram, feature_idx, Y, min_samples_leaf,
+                                child_stats=None):
+        # The search only needs the number of samples and the sum of Y in each bin, so the
+        # complexity is O(number of bins) once the statistics are available.
+        counts, sums = histogram.get_stats(Y)
+        counts, sums = counts[feature_idx], sums[feature_idx]
+
+        # Only cut right after non-empty bins to skip equivalent cuts:
+        i, mse = self._get_block_cutpoint(counts, sums, Y, counts[:-1] > 0, min_samples_leaf,
+                                          child_stats)
+        if i is None:
+            return return_no_split()
+        else:
+            return histogram.bin_edges[feature_idx][i], mse
+
+    def _get_sparse_cutpoint(self, X, feature_idx, Y, min_samples_leaf, child_stats=None):
+        # Every nonzero value is a block of its own, and all zeros form a single block between
+        # the negative and positive values. The complexity is O(k*log(k)) where k is the
+        # number of nonzero values, plus O(n) to sum Y once.
+        self._init_inverse_covariance_matrix(Y)
+        begin, end = X.indptr[feature_idx], X.indptr[feature_idx + 1]
+        rows, values = X.indices[begin:end], X.data[begin:end]
+        rows, values = rows[values != 0], values[values != 0]
+
+        order = np.argsort(values, kind='mergesort')
+        rows, values = rows[order], values[order]
+        nonzero_Y = Y[rows]
+
+        num_negative = np.searchsorted(values, 0.)
+        num_zeros = Y.shape[0] - values.shape[0]
+        if num_zeros > 0:
+            values = np.insert(values, num_negative, 0.)
+            counts = np.insert(np.ones(nonzero_Y.shape[0], dtype=np.intp), num_negative, num_zeros)
+            sums = np.insert(nonzero_Y, num_negative, Y.sum(axis=0) - nonzero_Y.sum(axis=0), axis=0)
+        else:
+            counts, sums = np.ones(nonzero_Y.shape[0], dtype=np.intp), nonzero_Y
+
+        i, mse = self._get_block_cutpoint(counts, sums, Y, values[1:] > values[:-1],
+                                          min_samples_leaf, child_stats)
+        if i is None:
+            return return_no_split()
+        else:
+            return (values[i] + values[i + 1]) / 2., mse
+
+    def _init_inverse_covariance_matrix(self, Y):
         if self.inverse_covariance_matrix is None:
             self.inverse_covariance_matrix = np.identity(Y.shape[1])
 
-        return super(self.__class__, self).get_best_cutpoint(feature, Y, min_samples_leaf, **kwargs)
\ No newline at end of file
+    def get_best_cutpoint(self, feature, Y, min_samples_leaf, **kwargs):
+        self._init_inverse_covariance_matrix(Y)
+
+        return super(MSESplitter, self).get_best_cutpoint(feature, Y, min_samples_leaf, **kwargs)
+
+    def select_feature_to_cut(self, X, Y, min_samples_leaf, **kwargs):
+        # Lazily computed values are prepared here so that threads only read them:
+        self._init_inverse_covariance_matrix(Y)
+        if kwargs.get('histogram') is not None:
+            kwargs['histogram'].get_stats(Y)
+
+        return super(MSESplitter, self).select_feature_to_cut(X, Y, min_samples_leaf, **kwargs)
\ No newline at end of file
@@ -0,0 +1,141 @@
+from __future__ import absolute_import
+
+import numpy as np
+from scipy import sparse
+
+from .base import return_no_split
+from .mse_splitter import (
+    MSESplitter,
+    _set_child_means,
+)
+
+
+def _get_scales(X):
+    """
+    :param X: numpy matrix or scipy sparse matrix
+    :return: a numpy array of the standard deviation of every column of X
+    """
+    if sparse.issparse(X):
+        means = np.asarray(X.mean(axis=0)).ravel()
+        variances = np.asarray(X.multiply(X).mean(axis=0)).ravel() - np.square(means)
+    else:
+        variances = X.var(axis=0)
+
+    return np.sqrt(np.maximum(variances, 0.))
+
+
+class ObliqueMSESplitter(MSESplitter):
+    """
+    An MSESplitter that also searches hyperplane cuts, coeffs . x <= threshold. The best
+    axis-aligned cut is found first as in MSESplitter. Then num_projections random directions
+    are tried, each combining the feature of that cut with (num_features_per_projection - 1)
+    other random features. All projections are searched at once by a vectorized version of
+    the ordered search of MSESplitter, and a hyperplane cut is only used if it is strictly
+    better than the axis-aligned cut.
+
+    The search keeps temporary arrays of (number of samples x num_projections x number of
+    targets) elements.
+    """
+    def __init__(self, num_projections=50, num_features_per_projection=2, *args, **kwargs):
+        """
+        :param num_projections: number of random directions tried at every node
+        :param num_features_per_projection: number of features combined by each direction
+
+        Directions are drawn from random_state (see Splitter).
+        """
+        super(ObliqueMSESplitter, self).__init__(*args, **kwargs)
+
+        assert num_features_per_projection >= 1, 'num_features_per_projection should be positive.'
+        self.num_projections = num_projections
+        self.num_features_per_projection = num_features_per_projection
+
+    def _get_projections(self, scales, anchor_idx):
+        """
+        :param scales: numpy array of the standard deviation of every feature
+        :param anchor_idx: a feature that every direction includes, or None
+        :return: a numpy matrix of directions, one per column. The weights are divided by the
+                 scales so that features contribute on comparable scales.
+        """
+        candidates = np.flatnonzero(scales > 0)
+        if anchor_idx is not None:
+            candidates = candidates[candidates != anchor_idx]
+
+        num_random = min(self.num_features_per_projection - (anchor_idx is not None),
+                         len(candidates))
+        projections = np.zeros((scales.shape[0], self.num_projections))
+        for j in range(self.num_projections):
+            features = self.random_state.choice(candidates, num_random, replace=False)
+            projections[features, j] = self.random_state.normal(size=num_random) / scales[features]
+            if anchor_idx is not None:
+                projections[anchor_idx, j] = 1. / scales[anchor_idx]
+
+        return projections
+
+    def _get_projection_cutpoints(self, projected, Y, min_samples_leaf, child_stats=None):
+        """
+        Same as ._get_ordered_cutpoint() on every column of projected, vectorized over the
+        columns.
+
+        :param projected: numpy matrix of projected features, one column per direction
+        :return: a tuple of (column of the best cut, cutpoint, cost). The column and
+                 cutpoint are None if there is no cut.
+        """
+        sorted_idx = np.argsort(projected, axis=0)
+        projected = np.take_along_axis(projected, sorted_idx, axis=0)
+        # Rows of Y in the order of every column, shaped (samples, columns, targets):
+        Y_sorted = Y[sorted_idx]
+
+        # Sums are centered as in ._get_ordered_cutpoint() so that they keep the differences
+        # between cuts when Y has a large offset:
+        means = Y.mean(axis=0)
+        errors = Y - means
+        Sl = np.cumsum(errors[sorted_idx[:-1]], axis=0, dtype=float)
+        Sr = errors.sum(axis=0) - Sl
+        Nl = np.arange(1, projected.shape[0])
+        Nr = projected.shape[0] - Nl
+
+        # A cut can only be placed between distinct values:
+        is_valid = ((projected[1:] > projected[:-1]) &
+                    (np.minimum(Nl, Nr) >= min_samples_leaf)[:, np.newaxis])
+
+        split_values = (self.mahalanobis_distances(Sl) / Nl[:, np.newaxis] +
+                        self.mahalanobis_distances(Sr) / Nr[:, np.newaxis])
+        split_values[~is_valid] = -np.inf
+
+        if split_values.size > 0:
+            # argmax() returns the first of tied maxima, i.e., the earliest cut of the
+            # earliest direction:
+            i, j = np.unravel_index(np.argmax(split_values.T), split_values.T.shape)[::-1]
+            if is_valid[i, j] and self._is_positive_gain(split_values[i, j], means, Y.shape[0]):
+                _set_child_means(child_stats, means + Sl[i, j] / Nl[i], means + Sr[i, j] / Nr[i])
+
+                cutpoint = (projected[i, j] + projected[i + 1, j]) / 2.
+                # The cost is computed from the children like in ._get_ordered_cutpoint(), so
+                # that it can be compared with the cost of the axis-aligned cut:
+                left_y, right_y = Y_sorted[:i + 1, j], Y_sorted[i + 1:, j]
+                cost = (np.sum(np.square(left_y - left_y.mean())) +
+                        np.sum(np.square(right_y - right_y.mean()))) / Y.shape[0]
+                return j, cutpoint, cost
+
+        return (None, ) + return_no_split()
+
+    def select_feature_to_cut(self, X, Y, min_samples_leaf, child_stats=None, **kwargs):
+        coeffs, cutpoint, cost = super(ObliqueMSESplitter, self).select_feature_to_cut(
+            X, Y, min_samples_leaf, child_stats=child_stats, **kwargs)
+
+        anchor_idx = None if coeffs is None else np.flatnonzero(coeffs)[0]
+        projections = self._get_projections(_get_scales(X), anchor_idx)
+        projected = X.dot(projections) if sparse.issparse(X) else np.matmul(X, projections)
+
+        oblique_stats = None if child_stats is None else {}
+        j, oblique_cutpoint, oblique_cost = self._get_projection_cutpoints(
+            projected, Y, min_samples_leaf, child_stats=oblique_stats)
+
+        # Axis-aligned cuts are cheaper to evaluate, so ties and rounding go their way:
+        if j is not None and oblique_cost < cost and not np.isclose(oblique_cost, cost):
+            if child_stats is not None:
+                child_stats.clear()
+                child_stats.update(oblique_stats)
+            return projections[:, j], oblique_cutpoint, oblique_cost
+
+        return coeffs, cutpoint, cost
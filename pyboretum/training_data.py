@@ -1,5 +1,9 @@
 import numpy as np
 import pandas as pd
+from scipy import sparse
+
+from pyboretum.histogram import Histogram
+from pyboretum.utils import get_feature_types
 
 
 def enforce_matrix(array):
@@ -9,6 +13,18 @@ def enforce_matrix(array):
         return array
 
 
+def _permute_rows(array, order):
+    """
+    Reorders the rows of array in place. Columns are moved one at a time so that only a
+    single column is copied at any moment.
+    """
+    if array.ndim == 1:
+        array[:] = array[order]
+    else:
+        for idx in range(array.shape[1]):
+            array[:, idx] = array[order, idx]
+
+
 class TrainingData(object):
     """
     A class for standardizing and storing Tree training data w/ following attributes:
@@ -18,10 +34,28 @@ class TrainingData(object):
         index: the index/ID of the samples in X and y
         X_names: the names of features in X
         Y_names: the names of targets in y
-
-    Can be initialized with either DataFrame or numpy array objects
+        sorted_idx: None, or a numpy matrix whose columns are the row positions that sort
+                    the corresponding columns of X (see .presort())
+        histogram: None, or a Histogram of X (see .bin())
+        in_place: whether descendants are views of this object's arrays (see
+                  .partition_in_place())
+        root_index, index_offset: for in-place data, the index of the data that
+                                  .partition_in_place() was called on, and the position of
+                                  this object's rows in it
+        feature_types: numpy array with the type of each column of X (see
+                       pyboretum.utils.get_feature_types()), shared by all descendants
+        stats: None, or a dictionary from functions in Node.Y_FUNS to their values over Y,
+               which were computed by the splitter that created this data
+        child_stats: None, or a dictionary with 'left' and 'right' stats of the descendants,
+                     which is set when the cut of this data is chosen (see
+                     Splitter.select_feature_to_cut())
+
+    Can be initialized with either DataFrame or numpy array objects. X can also be a scipy
+    sparse matrix, which is stored in CSC format without being densified.
     """
-    def __init__(self, X, Y, index=None, X_names=None, Y_names=None):
+    def __init__(self, X, Y, index=None, X_names=None, Y_names=None, sorted_idx=None,
+                 histogram=None, in_place=False, feature_types=None, stats=None,
+                 root_index=None, index_offset=0):
         # TODO: should this work for any combinations of DataFrames and numpy matrices for X and Y?
         if isinstance(X, pd.DataFrame):
             # Sort X and y with pandas to match their indices:
@@ -38,8 +72,14 @@ class TrainingData(object):
             self.X = X.values
             self.Y = Y.values
 
-        elif isinstance(X, np.ndarray):
-            self.X = enforce_matrix(X)
+        elif isinstance(X, np.ndarray) or sparse.issparse(X):
+            if sparse.issparse(X):
+                # Splitters search one column at a time, so sparse X is kept in CSC format:
+                self.X = X.tocsc()
+                if not self.X.has_sorted_indices:
+                    self.X = self.X.sorted_indices()
+            else:
+                self.X = enforce_matrix(X)
             self.Y = enforce_matrix(Y)
 
             if index is None:
@@ -55,19 +95,153 @@ class TrainingData(object):
             assert len(self.Y_names) == self.Y.shape[1], 'Y_names does not match in length with Y.'
 
         else:
-            raise TypeError("Input X must be pandas dataframe or numpy array.")
+            raise TypeError("Input X must be pandas dataframe, numpy array or scipy sparse matrix.")
+
+        self.sorted_idx = sorted_idx
+        self.histogram = histogram
+        self.in_place = in_place
+        self.root_index = root_index
+        self.index_offset = index_offset
+        self.feature_types = get_feature_types(self.X) if feature_types is None else feature_types
+        self.stats = stats
+        self.child_stats = None
+
+    def presort(self):
+        """
+        Sorts every column of X once. The sorted positions are carried down to descendants
+        by .get_descendants(), so splitters do not have to sort again at every node.
+        """
+        assert not sparse.issparse(self.X), '.presort() does not support sparse X.'
+        dtype = np.int32 if self.X.shape[0] < np.iinfo(np.int32).max else np.intp
+        self.sorted_idx = np.argsort(self.X, axis=0, kind='mergesort').astype(dtype)
+
+    def bin(self, max_bins):
+        """
+        Quantizes every column of X once into at most max_bins bins. The bins are carried down
+        to descendants by .get_descendants(), and splitters search cuts between bins only.
+        """
+        assert not sparse.issparse(self.X), '.bin() does not support sparse X.'
+        self.histogram = Histogram.from_features(self.X, max_bins)
+
+    def partition_in_place(self):
+        """
+        Takes a private copy of X, Y and index once. From then on, .get_descendants() reorders
+        the rows in place so that each child owns a contiguous slice, and the children are
+        views instead of copies. Memory during fitting then stays close to the size of the
+        data regardless of the depth of the tree.
+        """
+        assert not sparse.issparse(self.X), '.partition_in_place() does not support sparse X.'
+        self.X = np.array(self.X)
+        self.Y = np.array(self.Y)
+        self.index = np.array(self.index)
+        self.in_place = True
+        self.root_index = self.index
+        self.index_offset = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.in_place:
+            # Pickle copies views, so the copy of the index becomes the root of descendants:
+            state['root_index'] = self.index
+            state['index_offset'] = 0
+
+        return state
+
+    def _partition_sorted_idx_in_place(self, mask, num_left):
+        """
+        Same as ._partition_sorted_idx() for both children at once, written back into
+        sorted_idx with the left rows first.
+        """
+        left_positions = (np.cumsum(mask) - 1).astype(self.sorted_idx.dtype)
+        right_positions = (np.cumsum(~mask) - 1).astype(self.sorted_idx.dtype)
+        for idx in range(self.sorted_idx.shape[1]):
+            column = self.sorted_idx[:, idx]
+            in_mask = mask[column]
+            left_column = left_positions[column[in_mask]]
+            right_column = right_positions[column[~in_mask]]
+
+            column[:num_left] = left_column
+            column[num_left:] = right_column
+
+    def _get_child_stats(self, side):
+        return None if self.child_stats is None else self.child_stats.get(side)
+
+    def _get_descendants_in_place(self, mask):
+        num_left = np.count_nonzero(mask)
+
+        # A stable partition with the left rows first:
+        order = np.concatenate([np.flatnonzero(mask), np.flatnonzero(~mask)])
+        for array in [self.X, self.Y, self.index]:
+            _permute_rows(array, order)
+
+        if self.sorted_idx is not None:
+            self._partition_sorted_idx_in_place(mask, num_left)
+
+        left_histogram, right_histogram = None, None
+        if self.histogram is not None:
+            _permute_rows(self.histogram.codes, order)
+            left_histogram, right_histogram = self.histogram.split(num_left, self.Y)
+
+        children = []
+        for rows, histogram, side, offset in [
+                (slice(None, num_left), left_histogram, 'left', 0),
+                (slice(num_left, None), right_histogram, 'right', num_left)]:
+            children.append(TrainingData(self.X[rows, :],
+                                         self.Y[rows, :],
+                                         self.index[rows],
+                                         self.X_names,
+                                         sorted_idx=(None if self.sorted_idx is None
+                                                     else self.sorted_idx[rows, :]),
+                                         histogram=histogram,
+                                         in_place=True,
+                                         feature_types=self.feature_types,
+                                         stats=self._get_child_stats(side),
+                                         root_index=self.root_index,
+                                         index_offset=self.index_offset + offset))
+
+        return tuple(children)
+
+    def _partition_sorted_idx(self, mask):
+        """
+        Stable partition of sorted_idx: each column keeps only the rows in mask, in the same
+        order, renumbered to the positions those rows have after X[mask, :].
+        """
+        if self.sorted_idx is None:
+            return None
+
+        in_mask = mask[self.sorted_idx]
+        new_positions = (np.cumsum(mask) - 1).astype(self.sorted_idx.dtype)
+
+        # Boolean indexing of the transposes keeps the order within each column:
+        sorted_idx = self.sorted_idx.T[in_mask.T].reshape(self.sorted_idx.shape[1], -1).T
+
+        return new_positions[sorted_idx]
 
     def get_descendants(self, node):
         mask = node.should_take_left(self.X)
+        if self.in_place:
+            return self._get_descendants_in_place(mask)
+
+        left_histogram, right_histogram = ((None, None) if self.histogram is None
+                                           else self.histogram.partition(mask, self.Y))
+
         left_data = TrainingData(self.X[mask, :],
                                  self.Y[mask, :],
                                  self.index[mask],
-                                 self.X_names)
+                                 self.X_names,
+                                 sorted_idx=self._partition_sorted_idx(mask),
+                                 histogram=left_histogram,
+                                 feature_types=self.feature_types,
+                                 stats=self._get_child_stats('left'))
 
         mask = ~mask
         right_data = TrainingData(self.X[mask, :],
                                   self.Y[mask, :],
                                   self.index[mask],
-                                  self.X_names)
+                                  self.X_names,
+                                  sorted_idx=self._partition_sorted_idx(mask),
+                                  histogram=right_histogram,
+                                  feature_types=self.feature_types,
+                                  stats=self._get_child_stats('right'))
 
         return left_data, right_data
\ No newline at end of file
@@ -1,4 +1,8 @@
 from __future__ import absolute_import
 
 from .linked_tree import LinkedTree
-from .list_tree import ListTree
\ No newline at end of file
+from .list_tree import (
+    ListTree,
+    SparseListTree,
+)
+from .compiled_tree import CompiledTree
@@ -0,0 +1,327 @@
+from __future__ import absolute_import
+
+import os
+
+import numpy as np
+from scipy import sparse
+
+from ..node import Node
+from .base import (
+    Tree,
+    TreeIterator,
+)
+
+
+class CompiledTree(Tree):
+    """
+    A read-only Tree that stores a fitted tree in parallel numpy arrays indexed by node ID:
+
+        features: index of the feature for axis-aligned cuts, -1 otherwise
+        coeff_rows: row of coeffs for hyperplane cuts, -1 otherwise
+        coeffs: matrix of coefficients, one row per hyperplane cut
+        thresholds: threshold of the cut, NaN when there is no cut
+        left_children, right_children: node IDs of the children, -1 for leaf nodes
+        depths: depth of the node
+        n_samples: number of training samples in the node
+        values: a dictionary from the names in Node.Y_FUNS to arrays of node values
+
+    Node IDs are positions in the arrays and the root node is always 0. Use .from_tree() to
+    compile any other Tree.
+    """
+    # Arrays that .save() writes as <name>.npy; node values are written as values.<key>.npy:
+    _ARRAY_NAMES = ('features', 'coeff_rows', 'coeffs', 'thresholds',
+                    'left_children', 'right_children', 'depths', 'n_samples')
+
+    def __init__(self, features, coeff_rows, coeffs, thresholds,
+                 left_children, right_children, depths, n_samples, values):
+        self.features = features
+        self.coeff_rows = coeff_rows
+        self.coeffs = coeffs
+        self.thresholds = thresholds
+        self.left_children = left_children
+        self.right_children = right_children
+        self.depths = depths
+        self.n_samples = n_samples
+        self.values = values
+
+    @classmethod
+    def from_tree(cls, tree):
+        """
+        Copies the structure and node values of a tree into arrays. Nodes are numbered in
+        depth-first order with left children first.
+
+        :param tree: a Tree object
+        :return: a CompiledTree object
+        """
+        nodes = []
+        left_children = []
+        right_children = []
+        depths = []
+
+        # Stack of (original node ID, compiled ID of the parent, is left child):
+        stack = [(tree.get_root_id(), -1, False)]
+        while stack:
+            node_id, parent, is_left = stack.pop()
+            node, depth = tree.get_node(node_id)
+
+            index = len(nodes)
+            nodes.append(node)
+            depths.append(depth)
+            left_children.append(-1)
+            right_children.append(-1)
+            if parent >= 0:
+                if is_left:
+                    left_children[parent] = index
+                else:
+                    right_children[parent] = index
+
+            left_id, right_id = tree.get_children_ids(node_id)
+            if left_id is not None:
+                stack.append((right_id, index, False))
+                stack.append((left_id, index, True))
+
+        features = np.full(len(nodes), -1, dtype=np.intp)
+        coeff_rows = np.full(len(nodes), -1, dtype=np.intp)
+        thresholds = np.full(len(nodes), np.nan)
+        oblique_coeffs = []
+        for index, node in enumerate(nodes):
+            if node.is_leaf():
+                continue
+
+            thresholds[index] = node.threshold
+            feature = node.feature
+            if feature is None:
+                coeff_rows[index] = len(oblique_coeffs)
+                oblique_coeffs.append(node.coeffs)
+            else:
+                features[index] = feature
+
+        num_features = max([len(node.coeffs) for node in nodes if not node.is_leaf()] or [0])
+        coeffs = (np.array(oblique_coeffs, dtype=float) if oblique_coeffs
+                  else np.zeros((0, num_features)))
+
+        values = {key: np.array([getattr(node, key) for node in nodes])
+                  for key in type(nodes[0]).Y_FUNS}
+
+        return cls(features, coeff_rows, coeffs, thresholds,
+                   np.array(left_children, dtype=np.intp),
+                   np.array(right_children, dtype=np.intp),
+                   np.array(depths, dtype=np.intp),
+                   np.array([node.n_samples for node in nodes], dtype=np.intp),
+                   values)
+
+    @classmethod
+    def concatenate(cls, trees):
+        """
+        Stacks the arrays of several compiled trees with the same node values into one
+        CompiledTree, so that all of them can be evaluated together (see .route()).
+
+        :param trees: a list of CompiledTree objects
+        :return: a tuple of (CompiledTree, numpy array with the node ID of every tree's root)
+        """
+        sizes = np.array([len(tree.features) for tree in trees], dtype=np.intp)
+        root_ids = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        coeff_offsets = np.cumsum([0] + [tree.coeffs.shape[0] for tree in trees])[:-1]
+
+        def offset_children(children, offset):
+            return np.where(children >= 0, children + offset, -1)
+
+        def offset_coeff_rows(coeff_rows, offset):
+            return np.where(coeff_rows >= 0, coeff_rows + offset, -1)
+
+        num_features = max(tree.num_features for tree in trees)
+        coeffs = np.zeros((sum(tree.coeffs.shape[0] for tree in trees), num_features))
+        for tree, offset in zip(trees, coeff_offsets):
+            coeffs[offset:offset + tree.coeffs.shape[0], :tree.num_features] = tree.coeffs
+
+        tree = cls(np.concatenate([tree.features for tree in trees]),
+                   np.concatenate([offset_coeff_rows(tree.coeff_rows, offset)
+                                   for tree, offset in zip(trees, coeff_offsets)]),
+                   coeffs,
+                   np.concatenate([tree.thresholds for tree in trees]),
+                   np.concatenate([offset_children(tree.left_children, root_id)
+                                   for tree, root_id in zip(trees, root_ids)]),
+                   np.concatenate([offset_children(tree.right_children, root_id)
+                                   for tree, root_id in zip(trees, root_ids)]),
+                   np.concatenate([tree.depths for tree in trees]),
+                   np.concatenate([tree.n_samples for tree in trees]),
+                   {key: np.concatenate([tree.values[key] for tree in trees])
+                    for key in trees[0].values})
+
+        return tree, root_ids
+
+    def save(self, path):
+        """
+        Writes every array to its own .npy file in the directory path, which is created if
+        needed.
+
+        :param path: a directory name
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        for name in self._ARRAY_NAMES:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        for key, values in self.values.items():
+            np.save(os.path.join(path, 'values.{}.npy'.format(key)), values)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Reads a tree written by .save(). By default, the arrays are memory-mapped, so loading
+        takes the same time for any number of nodes and processes that load the same files
+        share their pages.
+
+        :param path: a directory name
+        :param mmap_mode: passed to numpy.load(); None reads the arrays into memory
+        :return: a CompiledTree object
+        """
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in cls._ARRAY_NAMES}
+
+        values = {}
+        for file_name in os.listdir(path):
+            if file_name.startswith('values.') and file_name.endswith('.npy'):
+                values[file_name[len('values.'):-len('.npy')]] = np.load(
+                    os.path.join(path, file_name), mmap_mode=mmap_mode)
+
+        return cls(values=values, **arrays)
+
+    @property
+    def num_features(self):
+        return self.coeffs.shape[1]
+
+    def _does_node_exist(self, node_id):
+        return 0 <= node_id < len(self.features)
+
+    def get_root_id(self):
+        return 0
+
+    def get_iterator(self):
+        return _CompiledTreeIterator(self)
+
+    def get_node(self, node_id):
+        if self._does_node_exist(node_id):
+            return _CompiledNode(self, node_id), self.depths[node_id]
+        else:
+            return None, None
+
+    def get_children_ids(self, node_id):
+        if self._does_node_exist(node_id) and self.left_children[node_id] >= 0:
+            return self.left_children[node_id], self.right_children[node_id]
+        else:
+            return None, None
+
+    def insert_children(self, node_id, left_node, right_node):
+        raise NotImplementedError('CompiledTree is read-only.')
+
+    def get_coeffs(self, node_id):
+        """
+        :return: a dense numpy array of coefficients for the cut at the node, or None
+        """
+        if self.coeff_rows[node_id] >= 0:
+            return self.coeffs[self.coeff_rows[node_id]]
+
+        elif self.features[node_id] >= 0:
+            coeffs = np.zeros(self.num_features)
+            coeffs[self.features[node_id]] = 1.0
+            return coeffs
+
+        else:
+            return None
+
+    def apply(self, X):
+        """
+        Routes all rows of X down the tree one level at a time.
+
+        :param X: numpy matrix or scipy sparse matrix (CSR is the fastest)
+        :return: a numpy array with the ID of the leaf node each row falls into
+        """
+        return self.route(X, np.arange(X.shape[0]), np.zeros(X.shape[0], dtype=np.intp))
+
+    def route(self, X, rows, node_ids):
+        """
+        Same as .apply() for pairs of a row of X and the node where it starts, e.g., the
+        roots of the trees in a concatenated tree (see .concatenate()).
+
+        :param X: numpy matrix or scipy sparse matrix (CSR is the fastest)
+        :param rows: numpy array of rows of X; a row can appear more than once
+        :param node_ids: numpy array of the starting node of each row in rows
+        :return: a numpy array with the ID of the leaf node each pair falls into
+        """
+        is_sparse = sparse.issparse(X)
+        if is_sparse:
+            X = X.tocsr()
+
+        node_ids = np.array(node_ids, dtype=np.intp)
+        pairs = np.arange(rows.shape[0])
+        while pairs.shape[0] > 0:
+            current = node_ids[pairs]
+            is_internal = self.left_children[current] >= 0
+            pairs, current = pairs[is_internal], current[is_internal]
+            current_rows = rows[pairs]
+
+            features = self.features[current]
+            is_orthogonal = features >= 0
+            projections = np.empty(pairs.shape[0])
+            # Sparse matrices return np.matrix objects, which are flattened:
+            projections[is_orthogonal] = np.asarray(X[current_rows[is_orthogonal],
+                                                      features[is_orthogonal]]).ravel()
+
+            is_oblique = ~is_orthogonal
+            if is_oblique.any():
+                coeffs = self.coeffs[self.coeff_rows[current[is_oblique]]]
+                if is_sparse:
+                    projections[is_oblique] = np.asarray(
+                        X[current_rows[is_oblique], :].multiply(coeffs).sum(axis=1)).ravel()
+                else:
+                    projections[is_oblique] = np.einsum('ij,ij->i', X[current_rows[is_oblique], :],
+                                                        coeffs)
+
+            node_ids[pairs] = np.where(projections <= self.thresholds[current],
+                                       self.left_children[current],
+                                       self.right_children[current])
+
+        return node_ids
+
+
+class _CompiledNode(Node):
+    """
+    A Node object built from the arrays of a CompiledTree so that code written for Node
+    objects, e.g., visualization, keeps working.
+    """
+    # Node values are whatever the compiled tree has, so they are kept in a dictionary:
+    __slots__ = ('__dict__', )
+
+    def __init__(self, tree, node_id):
+        coeffs = tree.get_coeffs(node_id)
+        self._set('n_samples', tree.n_samples[node_id])
+        self._set('coeffs', coeffs)
+        self._set('threshold', None if coeffs is None else tree.thresholds[node_id])
+        self._set('feature', tree.features[node_id] if tree.features[node_id] >= 0 else None)
+
+        for key, values in tree.values.items():
+            self.__dict__[key] = values[node_id]
+
+
+class _CompiledTreeIterator(TreeIterator):
+    def __init__(self, tree, node_id=0):
+        self._tree = tree
+        self._node_id = node_id
+
+    def left_child(self):
+        assert not self.is_leaf(), 'This is a leaf node.'
+        self._node_id = self._tree.left_children[self._node_id]
+
+    def right_child(self):
+        assert not self.is_leaf(), 'This is a leaf node.'
+        self._node_id = self._tree.right_children[self._node_id]
+
+    def is_leaf(self):
+        return self._tree.left_children[self._node_id] < 0
+
+    def get_node(self):
+        return self._tree.get_node(self._node_id)
+
+    def get_id(self):
+        return self._node_id
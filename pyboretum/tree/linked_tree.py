@@ -10,6 +10,24 @@ class LinkedTree(Tree):
     def __init__(self, node):
         self._root = _SubTree(node)
 
+        # An index from node IDs to (subtree, depth) for constant-time lookups:
+        self._subtrees = {self._root.get_id(): (self._root, 0)}
+
+    def __getstate__(self):
+        # Node IDs change when nodes are unpickled, so the index is rebuilt instead:
+        return {'_root': self._root}
+
+    def __setstate__(self, state):
+        self._root = state['_root']
+        self._subtrees = {}
+        stack = [(self._root, 0)]
+        while stack:
+            subtree, depth = stack.pop()
+            self._subtrees[subtree.get_id()] = (subtree, depth)
+            if subtree.left_subtree is not None:
+                stack.append((subtree.right_subtree, depth + 1))
+                stack.append((subtree.left_subtree, depth + 1))
+
     def get_root_id(self):
         return self._root.get_id()
 
@@ -17,22 +35,22 @@ class LinkedTree(Tree):
         return _LinkedTreeIterator(self._root)
 
     def get_node(self, node_id):
-        subtree, depth = self._root.find_subtree(node_id, 0)
+        subtree, depth = self._subtrees.get(node_id, (None, None))
         if subtree is None:
             return None, None
         else:
             return subtree.node, depth
 
     def get_children_ids(self, node_id):
-        subtree, _ = self._root.find_subtree(node_id, 0)
-        if subtree.left_subtree is None:
+        subtree, _ = self._subtrees.get(node_id, (None, None))
+        if subtree is None or subtree.left_subtree is None:
             return None, None
 
         else:
             return subtree.left_subtree.get_id(), subtree.right_subtree.get_id()
 
     def insert_children(self, node_id, left_node, right_node):
-        subtree, _ = self._root.find_subtree(node_id, 0)
+        subtree, depth = self._subtrees.get(node_id, (None, None))
         assert subtree is not None, 'Node {} does not exist.'.format(node_id)
         assert subtree.left_subtree is None and subtree.right_subtree is None, \
             'Children nodes of {} already exist.'.format(node_id)
@@ -40,7 +58,11 @@ class LinkedTree(Tree):
         subtree.left_subtree = _SubTree(left_node)
         subtree.right_subtree = _SubTree(right_node)
 
-        return subtree.left_subtree.get_id(), subtree.right_subtree.get_id()
+        left_id, right_id = subtree.left_subtree.get_id(), subtree.right_subtree.get_id()
+        self._subtrees[left_id] = (subtree.left_subtree, depth + 1)
+        self._subtrees[right_id] = (subtree.right_subtree, depth + 1)
+
+        return left_id, right_id
 
 
 class _LinkedTreeIterator(TreeIterator):
@@ -76,20 +98,3 @@ class _SubTree(object):
 
     def get_id(self):
         return id(self.node)
-
-    def find_subtree(self, node_id, depth):
-        # This assumes that an ID is unique, which is guaranteed by id().
-        if self.get_id() == node_id:
-            return self, depth
-
-        elif self.left_subtree is None:
-            # This is a leaf node.
-            return None, None
-
-        else:
-            subtree, new_depth = self.left_subtree.find_subtree(node_id, depth + 1)
-            # If it is not found on the left path, try right:
-            if subtree is None:
-                subtree, new_depth = self.right_subtree.find_subtree(node_id, depth + 1)
-
-            return subtree, new_depth
@@ -1,7 +1,5 @@
 from __future__ import absolute_import
 
-import math
-
 from .base import (
     Tree,
     TreeIterator,
@@ -27,7 +25,8 @@ def _get_depth(node_index):
     :param node_index:
     :return: int for depth
     """
-    return int(math.log(node_index + 1, 2))
+    # bit_length() is exact even for the very large indices of deep trees:
+    return int(node_index + 1).bit_length() - 1
 
 
 class ListTree(Tree):
@@ -48,6 +47,12 @@ class ListTree(Tree):
         return (self._is_memory_allocated(node_id) and
                 self._array[node_id] is not None)
 
+    def _store(self, node_id, node):
+        if not self._is_memory_allocated(node_id):
+            self._array += [None] * (node_id - len(self._array) + 1)
+
+        self._array[node_id] = node
+
     def get_node(self, node_id):
         if self._does_node_exist(node_id):
             return self._array[node_id], _get_depth(node_id)
@@ -68,15 +73,35 @@ class ListTree(Tree):
         assert not self._does_node_exist(left_id) and not self._does_node_exist(right_id), \
             'Children nodes of {} already exist.'.format(node_id)
 
-        if not self._is_memory_allocated(right_id):
-            self._array += [None] * (right_id - len(self._array) + 1)
-
-        self._array[left_id] = left_node
-        self._array[right_id] = right_node
+        # Store the right node first to allocate memory only once:
+        self._store(right_id, right_node)
+        self._store(left_id, left_node)
 
         return left_id, right_id
 
 
+class SparseListTree(ListTree):
+    """
+    A ListTree that only stores the nodes that exist. Node IDs are the same heap-style
+    indices as ListTree, but memory grows with the number of nodes rather than 2^depth.
+    Use this for deep and unbalanced trees.
+    """
+    def __init__(self, node):
+        self._nodes = {0: node}
+
+    def _does_node_exist(self, node_id):
+        return node_id in self._nodes
+
+    def _store(self, node_id, node):
+        self._nodes[node_id] = node
+
+    def get_node(self, node_id):
+        if self._does_node_exist(node_id):
+            return self._nodes[node_id], _get_depth(node_id)
+        else:
+            return None, None
+
+
 class _ListTreeIterator(TreeIterator):
     def __init__(self, tree, index=0):
         # This assumes that the Tree is not updating during traversal.
@@ -98,7 +123,7 @@ class _ListTreeIterator(TreeIterator):
         return not self._tree._does_node_exist(left_id)
 
     def get_node(self):
-        return self._tree._array[self._index], _get_depth(self._index)
+        return self._tree.get_node(self._index)
 
     def get_id(self):
         return self._index
\ No newline at end of file
@@ -1,5 +1,115 @@
+import inspect
+import multiprocessing
+
 from scipy import sparse
 import numpy as np
+import pandas as pd
+
+
+def get_num_jobs(n_jobs):
+    """
+    :param n_jobs: a positive number of jobs, or -1 for one job per CPU
+    :return: the number of jobs to run
+    """
+    return multiprocessing.cpu_count() if n_jobs == -1 else n_jobs
+
+
+# Cache of get_accepted_arguments() by function:
+_ACCEPTED_ARGUMENTS = {}
+
+
+def get_accepted_arguments(fun):
+    """
+    :param fun: a function or method
+    :return: the set of argument names of fun, or None if fun accepts any keyword argument
+    """
+    fun = getattr(fun, '__func__', fun)
+    if fun not in _ACCEPTED_ARGUMENTS:
+        try:
+            spec = inspect.getfullargspec(fun)
+            names, varkw = spec.args + spec.kwonlyargs, spec.varkw
+        except AttributeError:
+            # Python 2:
+            spec = inspect.getargspec(fun)
+            names, varkw = spec.args, spec.keywords
+
+        _ACCEPTED_ARGUMENTS[fun] = None if varkw is not None else set(names)
+
+    return _ACCEPTED_ARGUMENTS[fun]
+
+
+def get_optional_kwargs(fun, **kwargs):
+    """
+    Selects the optional keyword arguments to call fun with. Arguments that are None or that
+    fun does not accept are left out, so that methods of user-defined classes that override
+    an extension point with its original signature are still called the same way.
+
+    :param fun: a function or method
+    :return: a dictionary of keyword arguments
+    """
+    accepted = get_accepted_arguments(fun)
+
+    return {key: value for key, value in kwargs.items()
+            if value is not None and (accepted is None or key in accepted)}
+
+
+def get_column_positions(X_names, columns):
+    """
+    Matches the columns of a DataFrame with the features of the training data.
+
+    :param X_names: the names of the features in the training data
+    :param columns: the columns of a DataFrame
+    :return: a numpy array with the position in columns of every name in X_names
+    """
+    missing_columns = [name for name in X_names if name not in columns]
+    if missing_columns:
+        raise ValueError('Following columns are missing from X: {}'.format(missing_columns))
+
+    return pd.Index(columns).get_indexer(X_names)
+
 
 def densify(feature):
-    return np.asarray(feature.todense())[:, 0] if sparse.issparse(feature) else feature
\ No newline at end of file
+    return np.asarray(feature.todense())[:, 0] if sparse.issparse(feature) else feature
+
+
+# Types of features returned by get_feature_types():
+CONSTANT_FEATURE = 0
+BINARY_FEATURE = 1
+ORDERED_FEATURE = 2
+
+
+def get_feature_types(X):
+    """
+    Classifies every column of X as CONSTANT_FEATURE (only zeros), BINARY_FEATURE (only zeros
+    and ones) or ORDERED_FEATURE. Every subset of the rows has the same properties, so the
+    types only have to be detected once for the whole training data.
+
+    :param X: numpy matrix or scipy sparse matrix
+    :return: a numpy array with the type of each column
+    """
+    is_sparse = sparse.issparse(X)
+    if is_sparse:
+        # Only stored values need to be checked since the others are zeros:
+        X = X.tocsc()
+
+    feature_types = np.full(X.shape[1], ORDERED_FEATURE, dtype=np.int8)
+    for idx in range(X.shape[1]):
+        values = X.data[X.indptr[idx]:X.indptr[idx + 1]] if is_sparse else X[:, idx]
+        is_zero = values == 0
+        if is_zero.all():
+            feature_types[idx] = CONSTANT_FEATURE
+        elif (is_zero | (values == 1)).all():
+            feature_types[idx] = BINARY_FEATURE
+
+    return feature_types
+
+
+def count_nonzero(X):
+    """
+    :param X: numpy matrix or scipy sparse matrix
+    :return: a numpy array with the number of nonzero values in each column
+    """
+    if sparse.issparse(X):
+        return np.asarray((X != 0).sum(axis=0)).ravel()
+    else:
+        return np.count_nonzero(X, axis=0)
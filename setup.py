@@ -26,6 +26,7 @@ setup(
         'sortedcontainers',
         'graphviz',
         'pandas',  # TODO; limit this to numpy eventually?
+        'scipy',
     ],
     tests_require=[
         'pytest',
@@ -99,4 +99,16 @@ def training_data_numpy():
                   10.4, 9.8, 9.8,
                   17.0, 16.9, 17.1])
 
-    return X, Y
\ No newline at end of file
+    return X, Y
+
+
+# A smooth function of the first two of four random features with noise, which ensembles
+# fit better than a single tree:
+#     f(x) = x0 + sin(x1)
+@pytest.fixture()
+def training_data_ensemble():
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(300, 4))
+    y = X[:, 0] + np.sin(X[:, 1]) + .3 * rng.normal(size=300)
+
+    return X, y
@@ -0,0 +1,50 @@
+import numpy as np
+
+from pyboretum.splitters.mae_splitter import (
+    MAE_AVL,
+    MAE_BIT,
+)
+
+
+def test_mae_bit_keeps_balance_with_add_remove():
+    y = list(range(500))
+    left_tree = None
+    right_tree = MAE_BIT(y, range(500))
+
+    assert right_tree.less_than_items == right_tree.greater_than_items == 250
+    assert right_tree.median == np.median(y)
+
+    for i in range(0, 490, 10):
+        right_tree.remove(range(i, i + 10))
+        if left_tree is None:
+            left_tree = MAE_BIT(y, range(i, i + 10))
+        else:
+            left_tree.add(range(i, i + 10))
+
+        assert right_tree.less_than_items == right_tree.greater_than_items
+        assert right_tree.median == np.median(y[(i + 10):])
+        assert left_tree.less_than_items == left_tree.greater_than_items
+        assert left_tree.median == np.median(y[:(i + 10)])
+
+    left_tree.add(range(490, 500))
+    assert left_tree.median == np.median(y)
+
+
+def test_mae_bit_matches_mae_avl():
+    np.random.seed(3)
+    y = np.round(np.random.normal(size=300), 1)
+    order = np.argsort(y, kind='mergesort')
+    ranks = np.empty(len(y), dtype=int)
+    ranks[order] = np.arange(len(y))
+    sorted_values = y[order].tolist()
+
+    mae_avl = MAE_AVL(y)
+    mae_bit = MAE_BIT(sorted_values, ranks.tolist())
+    for begin in range(0, 290, 7):
+        mae_avl.remove(y[begin:(begin + 7)])
+        mae_bit.remove(ranks[begin:(begin + 7)].tolist())
+
+        assert mae_bit.median == mae_avl.median
+        assert mae_bit.less_than_sum == mae_avl.less_than_sum
+        assert mae_bit.greater_than_sum == mae_avl.greater_than_sum
+        assert np.isclose(mae_bit.get_sad(), np.sum(np.abs(y[(begin + 7):] - np.median(y[(begin + 7):]))))
@@ -30,3 +30,46 @@ def test_min_samples_leaf_affects_mae_split(training_data_1d):
     index = np.argwhere(coeffs != 0.0)[0][0]
     assert training_data.X_names[index] in {'x', 0}
     assert cutpoint == 5.5
+
+
+def test_mae_splitter_matches_exhaustive_search():
+    np.random.seed(5)
+    feature = np.random.randint(0, 30, size=200).astype(float)
+    y = np.random.randint(0, 10, size=(200, 1)).astype(float)
+
+    expected_cutpoint, expected_sad = None, float('inf')
+    for cutpoint in np.unique(feature)[:-1] + .5:
+        left_y, right_y = y[feature <= cutpoint], y[feature > cutpoint]
+        sad = np.sum(np.abs(left_y - np.median(left_y))) + np.sum(np.abs(right_y - np.median(right_y)))
+        if sad < expected_sad:
+            expected_cutpoint, expected_sad = cutpoint, sad
+
+    cutpoint, mae = splitters.MAESplitter()._get_ordered_cutpoint(feature, y, 1)
+    assert cutpoint == expected_cutpoint
+    assert np.isclose(mae, expected_sad / 200.)
+
+
+def test_sad_curve_matches_exhaustive_search():
+    np.random.seed(7)
+    feature = np.random.uniform(size=50)
+    y = np.random.normal(size=(50, 1))
+
+    sorted_y = y[np.argsort(feature)]
+    expected = [np.sum(np.abs(sorted_y[:i] - np.median(sorted_y[:i]))) +
+                np.sum(np.abs(sorted_y[i:] - np.median(sorted_y[i:]))) for i in range(1, 50)]
+
+    sad_curve = splitters.MAESplitter().get_sad_curve(feature, y)
+    assert sad_curve.shape == (49, )
+    assert np.allclose(sad_curve, expected)
+
+
+def test_bulk_mae_splitter_matches_running_median():
+    np.random.seed(11)
+    feature = np.random.randint(0, 40, size=300).astype(float)
+    y = np.random.normal(size=(300, 1))
+
+    for min_samples_leaf in [1, 20, 140, 151]:
+        expected = splitters.MAESplitter()._get_ordered_cutpoint(feature, y, min_samples_leaf)
+        cutpoint, mae = splitters.MAESplitter(bulk=True)._get_ordered_cutpoint(feature, y, min_samples_leaf)
+        assert cutpoint == expected[0]
+        assert np.isclose(mae, expected[1])
@@ -1,3 +1,4 @@
+import pytest
 import numpy as np
 
 from pyboretum import splitters, TrainingData
@@ -41,3 +42,48 @@ def test_mse_splitter_in_2d_with_covariance(training_data_mrt):
     assert training_data.X_names[index] in {'x', 0}
     # Brute force revealed X <= 6.5 gives best MSE reduction
     assert cutpoint == 6.5
+
+
+def _scan_for_cutpoint(splitter, feature, Y, min_samples_leaf):
+    # Sequential scan that the vectorized implementation replaces:
+    sorted_idx = np.argsort(feature)
+    feature, Y = feature[sorted_idx], Y[sorted_idx]
+
+    best_value, best_cutpoint = 0.0, None
+    for i in range(feature.shape[0] - 1):
+        Nl, Nr = i + 1, feature.shape[0] - i - 1
+        if feature[i + 1] > feature[i] and min(Nl, Nr) >= min_samples_leaf:
+            value = (splitter.mahalanobis_distance(Y[:Nl].sum(axis=0, keepdims=True)) / Nl +
+                     splitter.mahalanobis_distance(Y[Nl:].sum(axis=0, keepdims=True)) / Nr)
+            if value > best_value:
+                best_value, best_cutpoint = value, (feature[i] + feature[i + 1]) / 2.
+
+    return best_cutpoint
+
+
+@pytest.mark.parametrize('num_targets, min_samples_leaf', [
+    (1, 1),
+    (1, 7),
+    (3, 1),
+    (3, 20),
+])
+def test_vectorized_cutpoints_match_sequential_scan(num_targets, min_samples_leaf):
+    rng = np.random.RandomState(num_targets * 100 + min_samples_leaf)
+    splitter = splitters.MSESplitter(np.atleast_2d(np.cov(rng.normal(size=(50, num_targets)).T)))
+
+    for _ in range(20):
+        # Many ties in the feature:
+        feature = rng.randint(0, 15, size=60).astype(float)
+        Y = rng.normal(size=(60, num_targets)) + (feature > 7).reshape(-1, 1)
+
+        cutpoint, _ = splitter.get_best_cutpoint(feature, Y, min_samples_leaf)
+        assert cutpoint == _scan_for_cutpoint(splitter, feature, Y, min_samples_leaf)
+
+
+def test_no_cut_is_found_for_constant_targets():
+    splitter = splitters.MSESplitter()
+    feature = np.arange(10, dtype=float)
+
+    cutpoint, cost = splitter.get_best_cutpoint(feature, np.zeros((10, 1)), 1)
+    assert cutpoint is None
+    assert cost == float('inf')
@@ -0,0 +1,120 @@
+import pytest
+import numpy as np
+from scipy import sparse
+
+from pyboretum import (
+    splitters,
+    DecisionTree,
+    MeanMedianAnalysisNode,
+    TrainingData,
+)
+
+
+@pytest.fixture()
+def training_data_diagonal():
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(200, 3))
+    y = np.where(X[:, 0] + X[:, 1] <= 1., 0., 10.) + .1 * rng.normal(size=200)
+
+    return X, y
+
+
+def test_projection_cutpoints_match_the_ordered_search(training_data_1d):
+    X, Y = training_data_1d
+    training_data = TrainingData(X, Y)
+    rng = np.random.RandomState(0)
+    projected = np.hstack([training_data.X, rng.uniform(size=(12, 4))])
+
+    splitter = splitters.ObliqueMSESplitter()
+    splitter._init_inverse_covariance_matrix(training_data.Y)
+    j, cutpoint, cost = splitter._get_projection_cutpoints(projected, training_data.Y, 2)
+
+    mse_splitter = splitters.MSESplitter()
+    mse_splitter._init_inverse_covariance_matrix(training_data.Y)
+    results = [mse_splitter._get_ordered_cutpoint(projected[:, idx], training_data.Y, 2)
+               for idx in range(projected.shape[1])]
+    costs = [result[1] for result in results]
+    assert j == np.argmin(costs)
+    assert cutpoint == results[j][0]
+    assert cost == pytest.approx(costs[j])
+
+
+def test_oblique_splitter_finds_a_diagonal_cut(training_data_diagonal):
+    X, y = training_data_diagonal
+
+    axis_coeffs, _, axis_cost = splitters.MSESplitter().select_feature_to_cut(X, y.reshape(-1, 1), 1)
+
+    child_stats = {}
+    splitter = splitters.ObliqueMSESplitter(num_projections=200, random_state=0)
+    coeffs, cutpoint, cost = splitter.select_feature_to_cut(X, y.reshape(-1, 1), 1,
+                                                            child_stats=child_stats)
+    assert cost < axis_cost / 10
+    assert np.count_nonzero(coeffs) == 2
+    assert coeffs[2] == 0.0
+    # The direction is close to x0 + x1:
+    assert coeffs[0] / coeffs[1] == pytest.approx(1., rel=.2)
+
+    mask = np.matmul(X, coeffs) <= cutpoint
+    assert child_stats['left'][np.mean] == pytest.approx(y[mask].mean())
+    assert child_stats['right'][np.mean] == pytest.approx(y[~mask].mean())
+
+
+def test_oblique_splitter_keeps_axis_aligned_cuts(training_data_1d):
+    X, Y = training_data_1d
+    training_data = TrainingData(X, Y)
+
+    expected = splitters.MSESplitter().select_feature_to_cut(training_data.X, training_data.Y, 1)
+    coeffs, cutpoint, cost = splitters.ObliqueMSESplitter(random_state=0).select_feature_to_cut(
+        training_data.X, training_data.Y, 1)
+
+    assert coeffs.tolist() == expected[0].tolist()
+    assert (cutpoint, cost) == expected[1:]
+
+
+def test_oblique_splitter_keeps_axis_aligned_cuts_with_a_large_offset():
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(200, 3))
+    Y = (np.where(X[:, 0] <= .5, 0., 10.) + rng.normal(size=200) + 1e8).reshape(-1, 1)
+
+    expected = splitters.MSESplitter().select_feature_to_cut(X, Y, 5)
+    coeffs, cutpoint, cost = splitters.ObliqueMSESplitter(random_state=0).select_feature_to_cut(
+        X, Y, 5)
+
+    assert coeffs.tolist() == expected[0].tolist() == [1., 0., 0.]
+    assert (cutpoint, cost) == expected[1:]
+
+    # Costs of hyperplane cuts are exact too:
+    projected = np.matmul(X, rng.normal(size=(3, 4)))
+    splitter = splitters.ObliqueMSESplitter()
+    splitter._init_inverse_covariance_matrix(Y)
+    j, cutpoint, cost = splitter._get_projection_cutpoints(projected, Y, 5)
+    mask = projected[:, j] <= cutpoint
+    expected_cost = (np.square(Y[mask] - Y[mask].mean()).sum() +
+                     np.square(Y[~mask] - Y[~mask].mean()).sum()) / len(Y)
+    assert cost == pytest.approx(expected_cost)
+
+
+@pytest.mark.parametrize('to_sparse', [False, True])
+def test_oblique_tree_beats_an_axis_aligned_tree_of_the_same_depth(to_sparse, training_data_diagonal):
+    X, y = training_data_diagonal
+    X_fit = sparse.csc_matrix(X) if to_sparse else X
+
+    tree = DecisionTree(node_class=MeanMedianAnalysisNode, max_depth=2, min_samples_leaf=5)
+    tree.fit(X_fit, y)
+    oblique_tree = DecisionTree(node_class=MeanMedianAnalysisNode, max_depth=2, min_samples_leaf=5)
+    oblique_tree.fit(X_fit, y, splitter=splitters.ObliqueMSESplitter(random_state=0))
+
+    error = np.square(tree.predict(X_fit) - y.reshape(-1, 1)).mean()
+    oblique_error = np.square(oblique_tree.predict(X_fit) - y.reshape(-1, 1)).mean()
+    assert oblique_error < error / 2
+
+    # Saved IDs follow the hyperplane cuts and compiled trees predict the same:
+    root, _ = oblique_tree.tree.get_node(oblique_tree.tree.get_root_id())
+    assert root.feature is None
+    left_id, _ = oblique_tree.tree.get_children_ids(oblique_tree.tree.get_root_id())
+    left, _ = oblique_tree.tree.get_node(left_id)
+    assert sorted(left.saved_ids.tolist()) == np.flatnonzero(np.matmul(X, root.coeffs) <= root.threshold).tolist()
+
+    preds = oblique_tree.predict(X_fit)
+    oblique_tree.compile()
+    assert oblique_tree.predict(X_fit) == pytest.approx(preds)
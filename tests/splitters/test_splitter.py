@@ -1,9 +1,18 @@
+import pickle
+
+import numpy as np
 import pytest
+from scipy import sparse
 
 from pyboretum import (
     splitters,
     TrainingData,
 )
+from pyboretum.histogram import Histogram
+from pyboretum.utils import (
+    BINARY_FEATURE,
+    ORDERED_FEATURE,
+)
 
 
 @pytest.mark.parametrize('splitter', [
@@ -22,3 +31,187 @@ def test_min_samples_leaf_can_stop_splitting(splitter, training_data_1d):
     assert cutpoint == None
     assert cost == float('inf')
 
+
+@pytest.mark.parametrize('splitter_class', [
+    splitters.MSESplitter,
+    splitters.MAESplitter,
+])
+def test_n_jobs_gives_the_same_cut_as_serial(splitter_class):
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 20, size=(300, 12)).astype(float)
+    # Duplicated columns produce ties between features:
+    X[:, 7] = X[:, 3]
+    X[:, 10] = X[:, 3]
+    Y = (X[:, 3] > 9).reshape(-1, 1) + .1 * rng.normal(size=(300, 1))
+
+    expected = splitter_class().select_feature_to_cut(X, Y, 5)
+
+    splitter = splitter_class(n_jobs=4)
+    coeffs, cutpoint, cost = splitter.select_feature_to_cut(X, Y, 5)
+    assert coeffs.tolist() == expected[0].tolist()
+    assert np.argmax(coeffs) == 3
+    assert (cutpoint, cost) == expected[1:]
+
+    # Splitters can still be pickled after the thread pool is created:
+    restored = pickle.loads(pickle.dumps(splitter))
+    assert restored.n_jobs == 4
+    assert restored.select_feature_to_cut(X, Y, 5)[1] == cutpoint
+
+
+@pytest.mark.parametrize('splitter_class', [
+    splitters.MSESplitter,
+    splitters.MAESplitter,
+])
+def test_feature_types_give_the_same_cut_as_detection(splitter_class):
+    rng = np.random.RandomState(1)
+    X = np.hstack([rng.randint(0, 2, size=(200, 8)).astype(float),
+                   np.zeros((200, 1)),
+                   rng.normal(size=(200, 2))])
+    Y = (X[:, 5] + .3 * X[:, 9]).reshape(-1, 1) + .1 * rng.normal(size=(200, 1))
+    training_data = TrainingData(X, Y)
+
+    for min_samples_leaf in [1, 90, 101]:
+        expected = [splitter_class().get_best_cutpoint(X[:, idx], Y, min_samples_leaf)
+                    for idx in range(X.shape[1])]
+        binary = splitter_class()._get_binary_cutpoints(X[:, :8], Y, min_samples_leaf)
+        for (cutpoint, cost), (expected_cutpoint, expected_cost) in zip(binary, expected[:8]):
+            assert cutpoint == expected_cutpoint
+            assert np.isclose(cost, expected_cost)
+
+        coeffs, cutpoint, cost = splitter_class().select_feature_to_cut(
+            X, Y, min_samples_leaf, feature_types=training_data.feature_types)
+        expected_idx = np.argmin([cost for _, cost in expected])
+        if expected[expected_idx][0] is None:
+            assert coeffs is None
+        else:
+            assert np.argmax(coeffs) == expected_idx
+            assert np.isclose(cost, expected[expected_idx][1])
+
+
+@pytest.mark.parametrize('splitter_class, extra_rows', [
+    # MSESplitter keeps its original rule of more than min_samples_leaf rows per child for
+    # binary features:
+    (splitters.MSESplitter, 1),
+    (splitters.MAESplitter, 0),
+])
+def test_binary_cuts_respect_min_samples_leaf(splitter_class, extra_rows):
+    # The smaller child has 3 rows:
+    feature = np.array([0., 0., 0., 0., 0., 1., 1., 1.])
+    Y = np.array([1., 2., 1., 2., 1., 8., 9., 8.]).reshape(-1, 1)
+
+    for min_samples_leaf in [2, 3, 4]:
+        binary = splitter_class().get_best_cutpoint(feature, Y, min_samples_leaf,
+                                                    feature_type=BINARY_FEATURE)
+        binary_cutpoints = splitter_class()._get_binary_cutpoints(feature.reshape(-1, 1), Y,
+                                                                   min_samples_leaf)
+        assert (binary[0] is not None) == (3 >= min_samples_leaf + extra_rows)
+        assert binary_cutpoints[0][0] == binary[0]
+        assert np.isclose(binary_cutpoints[0][1], binary[1]) or binary[0] is None
+
+        # The ordered search allows exactly min_samples_leaf rows:
+        ordered = splitter_class().get_best_cutpoint(feature, Y, min_samples_leaf,
+                                                     feature_type=ORDERED_FEATURE)
+        assert (ordered[0] is not None) == (min_samples_leaf <= 3)
+        if binary[0] is not None:
+            assert binary[0] == ordered[0]
+            assert np.isclose(binary[1], ordered[1])
+
+
+@pytest.mark.parametrize('splitter_class', [
+    splitters.MSESplitter,
+    splitters.MAESplitter,
+])
+def test_max_features_only_searches_a_subset(splitter_class):
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(200, 6))
+    Y = X[:, :1] + .1 * rng.normal(size=(200, 1))
+
+    # The best feature is never chosen if it is not searched:
+    chosen = set()
+    splitter = splitter_class(max_features=2, random_state=0)
+    for _ in range(20):
+        coeffs, _, _ = splitter.select_feature_to_cut(X, Y, 5)
+        chosen.add(np.argmax(coeffs))
+    assert 0 in chosen
+    assert len(chosen) > 1
+
+    # All features are searched with a fraction of 1:
+    expected = splitter_class().select_feature_to_cut(X, Y, 5)
+    coeffs, cutpoint, cost = splitter_class(max_features=1.0).select_feature_to_cut(X, Y, 5)
+    assert coeffs.tolist() == expected[0].tolist()
+    assert (cutpoint, cost) == expected[1:]
+
+
+@pytest.mark.parametrize('splitter_class', [
+    splitters.MSESplitter,
+    splitters.MAESplitter,
+])
+def test_max_samples_computes_the_cost_on_all_rows(splitter_class):
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(1000, 3))
+    Y = (X[:, 1] > .5).reshape(-1, 1) + .1 * rng.normal(size=(1000, 1))
+
+    child_stats = {}
+    splitter = splitter_class(max_samples=100, random_state=0)
+    coeffs, cutpoint, cost = splitter.select_feature_to_cut(X, Y, 5, child_stats=child_stats)
+    assert np.argmax(coeffs) == 1
+    assert abs(cutpoint - .5) < .05
+    assert child_stats == {}
+
+    mask = X[:, 1] <= cutpoint
+    expected_cost = (mask.sum() * splitter.get_node_cost(Y[mask]) +
+                     (~mask).sum() * splitter.get_node_cost(Y[~mask])) / 1000.
+    assert cost == pytest.approx(expected_cost)
+
+
+@pytest.mark.parametrize('splitter_class', [
+    splitters.MSESplitter,
+    splitters.MAESplitter,
+])
+def test_max_thresholds_only_cuts_at_quantiles(splitter_class):
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(1000, 2))
+    Y = (X[:, 0] > .3).reshape(-1, 1) + .1 * rng.normal(size=(1000, 1))
+
+    splitter = splitter_class(max_thresholds=9)
+    edges = splitter._get_quantile_edges(X[:, 0])
+    assert len(edges) == 9
+
+    coeffs, cutpoint, cost = splitter.select_feature_to_cut(X, Y, 5)
+    assert np.argmax(coeffs) == 0
+    assert cutpoint == edges[2]
+
+    mask = X[:, 0] <= cutpoint
+    expected_cost = (mask.sum() * splitter.get_node_cost(Y[mask]) +
+                     (~mask).sum() * splitter.get_node_cost(Y[~mask])) / 1000.
+    assert cost == pytest.approx(expected_cost)
+
+
+class _BaselineSignatureSplitter(splitters.MSESplitter):
+    # Overrides the extension points without the options that were added to them later:
+    def _get_binary_cutpoint(self, feature, Y, min_samples_leaf):
+        return super(_BaselineSignatureSplitter, self)._get_binary_cutpoint(feature, Y,
+                                                                            min_samples_leaf)
+
+    def _get_ordered_cutpoint(self, feature, Y, min_samples_leaf):
+        return super(_BaselineSignatureSplitter, self)._get_ordered_cutpoint(feature, Y,
+                                                                             min_samples_leaf)
+
+
+def test_cutpoint_methods_with_the_baseline_signature_still_work():
+    rng = np.random.RandomState(0)
+    X = np.hstack([rng.randint(0, 2, size=(100, 3)), rng.normal(size=(100, 3))])
+    Y = (X[:, 1] + X[:, 4]).reshape(-1, 1) + .1 * rng.normal(size=(100, 1))
+    training_data = TrainingData(X, Y)
+
+    expected = splitters.MSESplitter().select_feature_to_cut(X, Y, 5)
+    for histogram in [None, Histogram.from_features(X, 255)]:
+        child_stats = {}
+        coeffs, cutpoint, cost = _BaselineSignatureSplitter().select_feature_to_cut(
+            X, Y, 5, feature_types=training_data.feature_types, child_stats=child_stats,
+            histogram=histogram)
+        assert coeffs.tolist() == expected[0].tolist()
+        assert np.isclose(cost, expected[2])
+
+    coeffs, _, _ = _BaselineSignatureSplitter().select_feature_to_cut(sparse.csc_matrix(X), Y, 5)
+    assert coeffs.tolist() == expected[0].tolist()
@@ -1,11 +1,18 @@
+import pickle
+
 import pytest
+import numpy as np
 import pandas as pd
 
 from pyboretum import (
     MeanNode,
     MedianNode,
+    MeanMedianAnalysisNode,
     splitters,  # MAE and MSE splitters
     DecisionTree,
+    LinkedTree,
+    ListTree,
+    SparseListTree,
 )
 
 
@@ -92,4 +99,251 @@ def test_mae_tree(training_data_1d):
         assert len(set(node_ids[begin_idx:end_idx])) == 1
 
 
-#TODO: write a test where training X is a dataframe, and the predicting X has a different column order.
\ No newline at end of file
+def test_sparse_list_tree_grows_deep_unbalanced_trees():
+    # Exponentially growing y makes MSE split off one sample at a time:
+    X = np.arange(80).reshape(-1, 1)
+    y = 2. ** np.arange(80)
+
+    tree = DecisionTree(tree_class=SparseListTree)
+    tree.fit(X, y)
+
+    # A ListTree would need 2^41 slots for this tree:
+    node_ids = tree.apply(X)
+    assert max(tree.tree.get_node(node_id)[1] for node_id in node_ids) >= 40
+    assert len(tree.tree._nodes) < 2 * len(X)
+    assert tree.predict(X)[-10:, 0].tolist() == y[-10:].tolist()
+
+
+@pytest.mark.parametrize('splitter', [
+    splitters.MSESplitter(),
+    splitters.MAESplitter(),
+])
+def test_presorted_fit_builds_the_same_tree(splitter, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=2)
+    tree.fit(X, y, splitter=splitter)
+
+    presorted_tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=2,
+                                  presort=True)
+    presorted_tree.fit(X, y, splitter=splitter)
+
+    assert (np.asarray(presorted_tree.predict(X)).tolist() ==
+            np.asarray(tree.predict(X)).tolist())
+    assert (len(presorted_tree.get_nodes_and_edges(float('inf'))[1]) ==
+            len(tree.get_nodes_and_edges(float('inf'))[1]))
+
+
+@pytest.mark.parametrize('growth', [
+    'depth_first',
+    'breadth_first',
+    'best_first',
+])
+def test_growth_strategies_build_the_same_full_tree(growth, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(tree_class=ListTree, min_samples_leaf=2)
+    tree.fit(X, y)
+
+    grown_tree = DecisionTree(tree_class=ListTree, min_samples_leaf=2, growth=growth)
+    grown_tree.fit(X, y)
+
+    assert grown_tree.get_nodes_and_edges(float('inf')) == tree.get_nodes_and_edges(float('inf'))
+
+
+@pytest.mark.parametrize('growth, expected', [
+    # The left node holds 10 and 17, the right node 25 and 15:
+    ('depth_first', [10.0, 17.0, 20.0]),
+    ('breadth_first', [10.0, 17.0, 20.0]),
+    # Splitting 25 and 15 reduces the error more:
+    ('best_first', [13.5, 15.0, 25.0]),
+])
+def test_max_leaf_nodes_stops_growth_in_order(growth, expected, training_data_1d):
+    X, y = training_data_1d
+    X = 11 - X
+
+    tree = DecisionTree(min_samples_leaf=2, growth=growth, max_leaf_nodes=3)
+    tree.fit(X, y)
+
+    assert len(set(tree.apply(X))) == 3
+    preds = np.asarray(tree.predict(X))[:, 0]
+    assert sorted(set(np.round(preds, 1))) == expected
+
+
+@pytest.mark.parametrize('growth', ['depth_first', 'breadth_first', 'best_first'])
+def test_trees_capped_by_max_leaf_nodes_can_be_visualized(growth, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(min_samples_leaf=2, growth=growth, max_leaf_nodes=3)
+    tree.fit(X, y)
+
+    # Nodes left unsplit are leaves:
+    nodes, edges = tree.get_nodes_and_edges(float('inf'))
+    assert sum(tree.tree.get_node(node_id)[0].is_leaf() for node_id in nodes) == 3
+    assert len(edges) == 4
+    tree.visualize_tree()
+
+    preds = tree.predict(X)
+    tree.compile()
+    # Compiled trees have other node IDs but the same shape:
+    compiled_nodes, compiled_edges = tree.get_nodes_and_edges(float('inf'))
+    assert (len(compiled_nodes), len(compiled_edges)) == (len(nodes), len(edges))
+    tree.visualize_tree()
+    assert np.asarray(tree.predict(X)) == pytest.approx(np.asarray(preds))
+
+
+def test_unknown_growth_strategy_fails():
+    with pytest.raises(AssertionError) as e:
+        DecisionTree(growth='random')
+    assert str(e.value) == 'Unknown growth strategy: random'
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'presort': True},
+    {'max_bins': 8},
+])
+@pytest.mark.parametrize('splitter', [
+    splitters.MSESplitter(),
+    splitters.MAESplitter(),
+])
+def test_partition_in_place_builds_the_same_tree(splitter, options, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(tree_class=ListTree, node_class=MeanMedianAnalysisNode,
+                        min_samples_leaf=2, **options)
+    tree.fit(X, y, splitter=splitter)
+
+    in_place_tree = DecisionTree(tree_class=ListTree, node_class=MeanMedianAnalysisNode,
+                                 min_samples_leaf=2, partition_in_place=True, **options)
+    in_place_tree.fit(X, y, splitter=splitter)
+
+    nodes, edges = tree.get_nodes_and_edges(float('inf'))
+    assert in_place_tree.get_nodes_and_edges(float('inf')) == (nodes, edges)
+    for node_id in nodes:
+        node, _ = tree.tree.get_node(node_id)
+        in_place_node, _ = in_place_tree.tree.get_node(node_id)
+        assert in_place_node.saved_ids.tolist() == node.saved_ids.tolist()
+        assert in_place_node.median == node.median
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_compact_ids_save_the_same_ids(n_jobs, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(tree_class=ListTree, node_class=MeanMedianAnalysisNode,
+                        min_samples_leaf=2)
+    tree.fit(X, y)
+
+    compact_tree = DecisionTree(tree_class=ListTree, node_class=MeanMedianAnalysisNode,
+                                min_samples_leaf=2, compact_ids=True, n_jobs=n_jobs,
+                                parallel_min_samples=4)
+    compact_tree.fit(X, y)
+
+    nodes, edges = tree.get_nodes_and_edges(float('inf'))
+    assert compact_tree.get_nodes_and_edges(float('inf')) == (nodes, edges)
+    for node_id in nodes:
+        node, _ = tree.tree.get_node(node_id)
+        compact_node, _ = compact_tree.tree.get_node(node_id)
+        # IDs within a node follow the shared permutation instead of the original order:
+        assert sorted(compact_node.saved_ids.tolist()) == sorted(node.saved_ids.tolist())
+
+
+def test_predict_matches_dataframe_columns_by_name():
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.uniform(size=(100, 3)), columns=['a', 'b', 'c'])
+    y = pd.Series(X['b'] + .1 * rng.normal(size=100))
+
+    tree = DecisionTree(min_samples_leaf=5)
+    tree.fit(X, y)
+    preds = tree.predict(X)
+
+    # Extra columns are ignored and the rest are reordered:
+    shuffled_X = X[['c', 'a', 'b']].assign(d=1.0)
+    assert tree.predict(shuffled_X).values.tolist() == preds.values.tolist()
+
+    with pytest.raises(ValueError) as e:
+        tree.predict(X[['a', 'c']])
+    assert str(e.value) == "Following columns are missing from X: ['b']"
+
+
+@pytest.mark.parametrize('compile_tree', [False, True])
+def test_predict_chunks_gives_the_same_predictions(compile_tree, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(min_samples_leaf=2)
+    tree.fit(X, y)
+    if compile_tree:
+        tree.compile()
+    preds = np.asarray(tree.predict(X))
+
+    # A single matrix is split into chunks:
+    chunks = list(tree.predict_chunks(X, chunk_size=5))
+    assert [len(chunk) for chunk in chunks] == [5, 5, 2]
+    assert np.concatenate([np.asarray(chunk) for chunk in chunks]).tolist() == preds.tolist()
+
+    # Any iterable of chunks works, e.g., a generator:
+    chunks = tree.predict_chunks(X[begin:begin + 4] for begin in range(0, 12, 4))
+    assert np.concatenate([np.asarray(chunk) for chunk in chunks]).tolist() == preds.tolist()
+
+
+@pytest.mark.parametrize('splitter, options', [
+    (splitters.MSESplitter(), {}),
+    (splitters.MSESplitter(), {'max_bins': 4}),
+    (splitters.MAESplitter(), {}),
+    (splitters.MAESplitter(bulk=True), {'partition_in_place': True}),
+    (splitters.MSESplitter(max_features=2, max_samples=100, random_state=0), {}),
+    (splitters.MAESplitter(max_thresholds=8), {}),
+])
+def test_node_stats_from_splitters_match_Y(splitter, options):
+    rng = np.random.RandomState(0)
+    X = np.hstack([rng.uniform(size=(300, 2)), rng.randint(0, 2, size=(300, 2))])
+    y = X[:, 0] + X[:, 2] + .1 * rng.normal(size=300)
+
+    tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=5, **options)
+    tree.fit(X, y, splitter=splitter)
+
+    stack = [tree.tree.get_root_id()]
+    while stack:
+        node_id = stack.pop()
+        node, _ = tree.tree.get_node(node_id)
+        assert np.allclose(node.mean, np.mean(y[node.saved_ids]))
+        assert node.median == np.median(y[node.saved_ids])
+
+        left_id, right_id = tree.tree.get_children_ids(node_id)
+        if left_id is not None:
+            stack.extend([left_id, right_id])
+
+
+@pytest.mark.parametrize('tree_class', [LinkedTree, ListTree, SparseListTree])
+def test_unpickled_tree_predicts_the_same(tree_class, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(tree_class=tree_class, node_class=MeanMedianAnalysisNode,
+                        min_samples_leaf=2)
+    tree.fit(X, y)
+
+    restored = pickle.loads(pickle.dumps(tree))
+    assert np.asarray(restored.predict(X)) == pytest.approx(np.asarray(tree.predict(X)))
+    nodes, edges = restored.get_nodes_and_edges(float('inf'))
+    assert len(nodes) == len(tree.get_nodes_and_edges(float('inf'))[0])
+    assert len(edges) == len(nodes) - 1
+    restored.visualize_tree()
+
+
+class _BaselineSignatureSplitter(splitters.MSESplitter):
+    # Overrides the extension point without the options that were added to it later:
+    def select_feature_to_cut(self, X, Y, min_samples_leaf):
+        return super(_BaselineSignatureSplitter, self).select_feature_to_cut(X, Y, min_samples_leaf)
+
+
+@pytest.mark.parametrize('tree_params', [{}, {'presort': True}, {'max_bins': 255}])
+def test_splitters_with_the_baseline_signature_still_fit(tree_params, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(min_samples_leaf=2)
+    tree.fit(X, y)
+
+    custom_tree = DecisionTree(min_samples_leaf=2, **tree_params)
+    custom_tree.fit(X, y, splitter=_BaselineSignatureSplitter())
+    assert np.asarray(custom_tree.predict(X)) == pytest.approx(np.asarray(tree.predict(X)))
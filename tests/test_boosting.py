@@ -0,0 +1,107 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from pyboretum import (
+    boosting as boosting_module,
+    splitters,
+    DecisionTree,
+    GradientBoosting,
+    MeanMedianAnalysisNode,
+    MeanNode,
+)
+
+
+def test_single_round_matches_a_decision_tree(training_data_1d):
+    X, Y = training_data_1d
+
+    boosting = GradientBoosting(n_estimators=1, learning_rate=1., min_samples_leaf=2)
+    boosting.fit(X, Y)
+    tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=2)
+    tree.fit(X, Y)
+
+    assert np.array(boosting.predict(X)) == pytest.approx(np.array(tree.predict(X)))
+
+
+@pytest.mark.parametrize('tree_params', [
+    {},
+    {'presort': True},
+    {'max_bins': 32},
+    {'presort': True, 'compact_ids': True},
+    {'max_bins': 32, 'partition_in_place': True},
+])
+def test_training_predictions_match_predict(tree_params, training_data_ensemble):
+    X, y = training_data_ensemble
+
+    boosting = GradientBoosting(n_estimators=10, max_depth=3, **tree_params)
+    boosting.fit(X, y)
+
+    # Training errors come from the leaf assignments and agree with predictions:
+    assert len(boosting.train_errors) == 10
+    assert boosting.train_errors[-1] == pytest.approx(
+        np.square(boosting.predict(X)[:, 0] - y).mean())
+    assert np.all(np.diff(boosting.train_errors) <= 0)
+    assert boosting.train_errors[-1] < y.var() / 2
+
+
+def test_reusing_presorted_data_gives_the_same_trees(training_data_ensemble):
+    X, y = training_data_ensemble
+
+    predictions = []
+    for tree_params in [{}, {'presort': True}, {'presort': True, 'partition_in_place': True}]:
+        boosting = GradientBoosting(n_estimators=5, max_depth=3, **tree_params)
+        boosting.fit(X, y)
+        predictions.append(boosting.predict(X))
+
+    assert predictions[1] == pytest.approx(predictions[0])
+    assert predictions[2] == pytest.approx(predictions[0])
+
+
+@pytest.mark.parametrize('max_routed_pairs', [1, 250, 2 ** 20])
+def test_predictions_are_the_sum_over_trees(max_routed_pairs, training_data_ensemble,
+                                            monkeypatch):
+    X, y = training_data_ensemble
+    monkeypatch.setattr(boosting_module, '_MAX_ROUTED_PAIRS', max_routed_pairs)
+
+    boosting = GradientBoosting(n_estimators=7, max_depth=3)
+    boosting.fit(X, y)
+
+    # Batches of any size give the same predictions as the trees one by one:
+    expected = boosting.init_prediction + boosting.learning_rate * np.sum(
+        [tree.predict(X) for tree in boosting.trees], axis=0)
+    assert boosting.predict(X) == pytest.approx(expected)
+
+
+def test_absolute_error(training_data_ensemble):
+    X, y = training_data_ensemble
+
+    boosting = GradientBoosting(n_estimators=5, loss='absolute_error', max_depth=2)
+    boosting.fit(X, y)
+
+    assert boosting.pred_str == 'median'
+    assert boosting.init_prediction == pytest.approx([np.median(y)])
+    assert boosting.train_errors[-1] == pytest.approx(
+        np.abs(boosting.predict(X)[:, 0] - y).mean())
+    assert boosting.train_errors[-1] < np.abs(y - np.median(y)).mean()
+
+
+def test_multivariate_targets_and_data_frames(training_data_ensemble):
+    X, y = training_data_ensemble
+    index = ['row_{}'.format(idx) for idx in range(len(X))]
+    X_df = pd.DataFrame(X, columns=['a', 'b', 'c', 'd'], index=index)
+    Y_df = pd.DataFrame({'y1': y, 'y2': X[:, 2]}, index=index)
+
+    boosting = GradientBoosting(n_estimators=5, max_depth=3)
+    boosting.fit(X_df, Y_df, splitter=splitters.MSESplitter())
+
+    # Columns are matched by name:
+    predicted = boosting.predict(X_df[['d', 'c', 'b', 'a']])
+    assert predicted.columns.tolist() == ['y1', 'y2']
+    assert predicted.index.tolist() == index
+    assert predicted.values == pytest.approx(boosting.predict(X))
+    assert boosting.train_errors[-1] == pytest.approx(np.square(predicted - Y_df).values.mean())
+
+
+def test_node_class_should_save_ids():
+    with pytest.raises(AssertionError):
+        GradientBoosting(node_class=MeanNode)
@@ -0,0 +1,139 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from pyboretum import (
+    DecisionTree,
+    CompiledTree,
+    MeanMedianAnalysisNode,
+    ListTree,
+    splitters,
+)
+
+
+@pytest.mark.parametrize('tree_class', [
+    None,  # Use the default
+    ListTree,
+])
+def test_compiled_tree_gives_the_same_predictions(tree_class, training_data_mrt):
+    X, Y = training_data_mrt
+
+    kwargs = {} if tree_class is None else {'tree_class': tree_class}
+    tree = DecisionTree(min_samples_leaf=2, **kwargs)
+    tree.fit(X, Y)
+
+    preds = tree.predict(X)
+    node_ids = tree.apply(X)
+
+    tree.compile()
+    assert isinstance(tree.tree, CompiledTree)
+
+    compiled_preds = tree.predict(X)
+    compiled_node_ids = tree.apply(X)
+    assert np.asarray(compiled_preds) == pytest.approx(np.asarray(preds))
+
+    # Node IDs change, but rows share leaves in exactly the same way:
+    mapping = dict(zip(node_ids, compiled_node_ids))
+    assert len(set(mapping.values())) == len(mapping)
+    assert [mapping[node_id] for node_id in node_ids] == compiled_node_ids.tolist()
+
+
+def test_compiled_tree_keeps_structure_and_values(training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=2, max_depth=2)
+    tree.fit(X, y, splitter=splitters.MSESplitter())
+    nodes, edges = tree.get_nodes_and_edges(max_depth=float('inf'))
+    labels = [tree.tree.get_node(node_id)[0].get_label('median', tree.X_names)
+              for node_id in nodes]
+
+    tree.compile()
+    compiled = tree.tree
+    assert sorted(compiled.values.keys()) == ['mean', 'median']
+    assert compiled.get_root_id() == 0
+    assert compiled.get_node(len(nodes)) == (None, None)
+
+    compiled_nodes, compiled_edges = tree.get_nodes_and_edges(max_depth=float('inf'))
+    assert compiled_nodes == list(range(len(nodes)))
+    assert len(compiled_edges) == len(edges)
+    assert [compiled.get_node(node_id)[0].get_label('median', tree.X_names)
+            for node_id in compiled_nodes] == labels
+
+    with pytest.raises(NotImplementedError):
+        compiled.insert_children(0, None, None)
+
+
+def test_compiled_tree_iterator(training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(min_samples_leaf=2)
+    tree.fit(X, y)
+    tree.compile()
+
+    iterator = tree.tree.get_iterator()
+    assert iterator.get_id() == 0
+    assert not iterator.is_leaf()
+
+    iterator.left_child()
+    node, depth = iterator.get_node()
+    assert depth == 1
+    assert node.threshold == 2.5
+
+    while not iterator.is_leaf():
+        iterator.right_child()
+    with pytest.raises(AssertionError):
+        iterator.left_child()
+
+
+def test_compiled_tree_supports_hyperplane_cuts():
+    X = np.array([[0., 0.], [1., 0.], [0., 1.], [1., 1.]])
+
+    compiled = CompiledTree(features=np.array([-1, -1, -1]),
+                            coeff_rows=np.array([0, -1, -1]),
+                            coeffs=np.array([[1.0, 1.0]]),
+                            thresholds=np.array([1.5, np.nan, np.nan]),
+                            left_children=np.array([1, -1, -1]),
+                            right_children=np.array([2, -1, -1]),
+                            depths=np.array([0, 1, 1]),
+                            n_samples=np.array([4, 3, 1]),
+                            values={'mean': np.array([1.0, 0.0, 2.0])})
+
+    assert compiled.apply(X).tolist() == [1, 1, 1, 2]
+    assert compiled.get_coeffs(0).tolist() == [1.0, 1.0]
+    assert compiled.get_coeffs(1) is None
+
+
+def test_compiled_tree_pickles_to_arrays(training_data_mrt):
+    X, Y = training_data_mrt
+
+    tree = DecisionTree(min_samples_leaf=2)
+    tree.fit(X, Y)
+    tree.compile()
+
+    restored = pickle.loads(pickle.dumps(tree))
+    assert np.asarray(restored.predict(X)) == pytest.approx(np.asarray(tree.predict(X)))
+
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_saved_tree_loads_with_the_same_predictions(mmap_mode, training_data_mrt, tmpdir):
+    X, Y = training_data_mrt
+
+    tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=2)
+    tree.fit(X, Y)
+    path = str(tmpdir.join('tree'))
+    tree.save(path)
+
+    # Saving does not compile the tree itself:
+    assert not isinstance(tree.tree, CompiledTree)
+
+    loaded = DecisionTree.load(path, mmap_mode=mmap_mode)
+    assert isinstance(loaded.tree, CompiledTree)
+    assert isinstance(loaded.tree.left_children, np.memmap) == (mmap_mode is not None)
+    assert sorted(loaded.tree.values.keys()) == ['mean', 'median']
+    assert list(loaded.X_names) == list(tree.X_names)
+
+    tree.compile()
+    assert np.asarray(loaded.predict(X)) == pytest.approx(np.asarray(tree.predict(X)))
+    assert np.asarray(loaded.predict(X, 'median')) == pytest.approx(np.asarray(tree.predict(X, 'median')))
+    assert loaded.apply(X).tolist() == tree.apply(X).tolist()
@@ -0,0 +1,118 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from pyboretum import (
+    splitters,
+    DecisionTree,
+    MeanMedianAnalysisNode,
+    MedianNode,
+    RandomForest,
+)
+from pyboretum.forest import get_sorted_idx_of_sample
+
+
+def test_get_sorted_idx_of_sample():
+    rng = np.random.RandomState(0)
+    X = rng.randint(5, size=(50, 3)).astype(float)
+    counts = rng.randint(3, size=50)
+
+    sorted_idx = np.argsort(X, axis=0, kind='mergesort')
+    expected = np.argsort(X[np.repeat(np.arange(50), counts)], axis=0, kind='mergesort')
+    assert (get_sorted_idx_of_sample(sorted_idx, counts) == expected).all()
+
+
+@pytest.mark.parametrize('tree_params', [{}, {'presort': True}, {'max_bins': 16}])
+def test_forest_without_bootstrap_matches_a_decision_tree(tree_params, training_data_1d):
+    X, Y = training_data_1d
+
+    tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=2, **tree_params)
+    tree.fit(X, Y)
+    forest = RandomForest(n_estimators=1, bootstrap=False, node_class=MeanMedianAnalysisNode,
+                          min_samples_leaf=2, **tree_params)
+    forest.fit(X, Y)
+
+    assert np.array(forest.predict(X)) == pytest.approx(np.array(tree.predict(X)))
+    # Without bootstrap, no row is out of the bag:
+    assert np.isnan(forest.oob_prediction).all()
+    assert np.isnan(forest.oob_error)
+
+
+@pytest.mark.parametrize('tree_params', [{}, {'presort': True}, {'max_bins': 32}])
+def test_forest_is_the_same_in_parallel(tree_params, training_data_ensemble):
+    X, y = training_data_ensemble
+
+    forests = []
+    for n_jobs in [1, 2]:
+        forest = RandomForest(n_estimators=4, n_jobs=n_jobs, random_state=0, min_samples_leaf=10,
+                              **tree_params)
+        forest.fit(X, y, splitter=splitters.MSESplitter(max_features=2))
+        forests.append(forest)
+
+    assert forests[0].predict(X).tolist() == forests[1].predict(X).tolist()
+    assert forests[0].oob_error == forests[1].oob_error
+    # Trees differ from each other:
+    assert len(set(tree.tree.thresholds[0] for tree in forests[0].trees)) > 1
+
+
+def test_oob_error(training_data_ensemble):
+    X, y = training_data_ensemble
+
+    forest = RandomForest(n_estimators=20, random_state=0, min_samples_leaf=10)
+    forest.fit(X, y)
+
+    has_oob = ~np.isnan(forest.oob_prediction[:, 0])
+    # Each row is out of the bag of about a third of the trees:
+    assert has_oob.all()
+    assert forest.oob_error == pytest.approx(np.square(forest.oob_prediction[:, 0] - y).mean())
+    # Out-of-bag error is higher than training error and lower than the variance:
+    train_error = np.square(forest.predict(X)[:, 0] - y).mean()
+    assert train_error < forest.oob_error < y.var()
+
+    # A single tree predicts the rows out of its bootstrap sample, about a third of them:
+    forest = RandomForest(n_estimators=1, random_state=0, min_samples_leaf=10)
+    forest.fit(X, y)
+
+    has_oob = ~np.isnan(forest.oob_prediction[:, 0])
+    assert .25 < has_oob.mean() < .45
+    assert forest.oob_prediction[has_oob] == pytest.approx(forest.trees[0].predict(X[has_oob]))
+
+
+def test_forest_predicts_the_mean_or_median_of_trees(training_data_ensemble):
+    X, y = training_data_ensemble
+
+    forest = RandomForest(n_estimators=5, random_state=0, node_class=MeanMedianAnalysisNode,
+                          min_samples_leaf=10)
+    forest.fit(X, y)
+
+    predictions = np.stack([tree.predict(X, pred_str='median') for tree in forest.trees])
+    assert forest.predict(X) == pytest.approx(np.stack(
+        [tree.predict(X) for tree in forest.trees]).mean(axis=0))
+    assert forest.predict(X, pred_str='median') == pytest.approx(np.median(predictions, axis=0))
+
+    median_forest = RandomForest(n_estimators=5, random_state=0, node_class=MedianNode,
+                                 min_samples_leaf=10)
+    median_forest.fit(X, y, splitter=splitters.MAESplitter())
+    assert median_forest.pred_str == 'median'
+    has_oob = ~np.isnan(median_forest.oob_prediction[:, 0])
+    assert median_forest.oob_error == pytest.approx(
+        np.abs(median_forest.oob_prediction[has_oob, 0] - y[has_oob]).mean())
+
+
+def test_forest_with_data_frames(training_data_ensemble):
+    X, y = training_data_ensemble
+    index = ['row_{}'.format(idx) for idx in range(len(X))]
+    X_df = pd.DataFrame(X, columns=['a', 'b', 'c', 'd'], index=index)
+    y_df = pd.Series(y, name='y', index=index)
+
+    forest = RandomForest(n_estimators=3, random_state=0, min_samples_leaf=10)
+    forest.fit(X_df, y_df)
+
+    # Columns are matched by name:
+    predicted = forest.predict(X_df[['d', 'c', 'b', 'a']])
+    assert predicted.columns.tolist() == ['y']
+    assert predicted.index.tolist() == index
+    assert predicted['y'].tolist() == forest.predict(X)[:, 0].tolist()
+    assert (forest.apply(X_df) == forest.apply(X)).all()
+    # Leaf IDs are those of the individual trees:
+    assert forest.apply(X)[:, 1].tolist() == forest.trees[1].apply(X).tolist()
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from pyboretum import (
+    DecisionTree,
+    MeanMedianAnalysisNode,
+    splitters,
+)
+from pyboretum.histogram import (
+    Histogram,
+    get_bin_edges,
+)
+
+
+def test_bin_edges_are_midpoints_for_few_distinct_values():
+    feature = np.array([3., 1., 2., 1., 5.])
+    assert get_bin_edges(feature, 4).tolist() == [1.5, 2.5, 4.0]
+
+
+def test_bin_edges_are_quantiles_for_many_distinct_values():
+    feature = np.random.RandomState(0).normal(size=1000)
+    edges = get_bin_edges(feature, 16)
+    assert len(edges) == 15
+
+    counts = np.bincount(np.searchsorted(edges, feature))
+    assert counts.min() > 50
+
+
+def test_codes_use_small_integers():
+    X = np.random.RandomState(0).normal(size=(1000, 2))
+
+    histogram = Histogram.from_features(X, 256)
+    assert histogram.codes.dtype == np.uint8
+
+    histogram = Histogram.from_features(X, 257)
+    assert histogram.codes.dtype == np.uint16
+
+    # Codes agree with the edges:
+    for idx in range(X.shape[1]):
+        edges = histogram.bin_edges[idx]
+        codes = histogram.codes[:, idx].astype(int)
+        assert (X[codes > 0, idx] > edges[codes[codes > 0] - 1]).all()
+        assert (X[codes < len(edges), idx] <= edges[codes[codes < len(edges)]]).all()
+
+
+@pytest.mark.parametrize('left_fraction', [.2, .8])
+def test_partition_derives_the_larger_child_by_subtraction(left_fraction):
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 10, size=(200, 3))
+    Y = rng.normal(size=(200, 2))
+    mask = rng.uniform(size=200) < left_fraction
+
+    histogram = Histogram.from_features(X, 8)
+    histogram.get_stats(Y)
+    left, right = histogram.partition(mask, Y)
+
+    for child, child_Y in [(left, Y[mask]), (right, Y[~mask])]:
+        counts, sums = child.get_stats(child_Y)
+        expected = Histogram(child.codes, child.bin_edges, child.num_bins)
+        expected_counts, expected_sums = expected.get_stats(child_Y)
+
+        assert counts.tolist() == expected_counts.tolist()
+        assert sums == pytest.approx(expected_sums)
+
+
+@pytest.mark.parametrize('splitter', [
+    splitters.MSESplitter(),
+    splitters.MAESplitter(),
+])
+def test_binned_fit_matches_exact_fit_with_enough_bins(splitter, training_data_1d):
+    X, y = training_data_1d
+
+    tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=2)
+    tree.fit(X, y, splitter=splitter)
+
+    binned_tree = DecisionTree(node_class=MeanMedianAnalysisNode, min_samples_leaf=2,
+                               max_bins=255)
+    binned_tree.fit(X, y, splitter=splitter)
+
+    # Leaf means come from the sums of each search, which are added up in different orders:
+    assert np.allclose(np.asarray(binned_tree.predict(X)), np.asarray(tree.predict(X)))
+    assert (np.asarray(binned_tree.predict(X, 'median')).tolist() ==
+            np.asarray(tree.predict(X, 'median')).tolist())
+
+
+def test_binned_mse_splitter_finds_the_same_cut_in_2d(training_data_mrt):
+    X, Y = training_data_mrt
+    X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+    mse_splitter = splitters.MSESplitter()
+
+    coeffs, cutpoint, cost = mse_splitter.select_feature_to_cut(
+        X, Y, 1, histogram=Histogram.from_features(X, 32))
+    assert cutpoint == 13.5
+
+    # The cost is the mean squared error around the means of the two children:
+    left, right = Y[X[:, 0] <= cutpoint], Y[X[:, 0] > cutpoint]
+    expected = (np.square(left - left.mean(axis=0)).sum() +
+                np.square(right - right.mean(axis=0)).sum()) / len(Y)
+    assert cost == pytest.approx(expected)
+
+
+def test_stats_are_the_same_when_counted_in_chunks(monkeypatch):
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 10, size=(100, 7))
+    Y = rng.normal(size=(100, 2))
+
+    counts, sums = Histogram.from_features(X, 8).get_stats(Y)
+
+    # Forces one feature per chunk:
+    monkeypatch.setattr('pyboretum.histogram._MAX_CHUNK_ELEMENTS', 100)
+    chunked_counts, chunked_sums = Histogram.from_features(X, 8).get_stats(Y)
+
+    assert chunked_counts.tolist() == counts.tolist()
+    assert chunked_sums == pytest.approx(sums)
+
+
+def test_binned_mse_cost_is_exact_with_a_large_offset(training_data_mrt):
+    X, Y = training_data_mrt
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float) + 1e8
+
+    _, cutpoint, cost = splitters.MSESplitter().select_feature_to_cut(
+        X, Y, 1, histogram=Histogram.from_features(X, 32))
+    assert cutpoint == 13.5
+
+    left, right = Y[X[:, 0] <= cutpoint], Y[X[:, 0] > cutpoint]
+    expected = (np.square(left - left.mean(axis=0)).sum() +
+                np.square(right - right.mean(axis=0)).sum()) / len(Y)
+    assert cost == pytest.approx(expected)
@@ -1,3 +1,6 @@
+import numpy as np
+import pytest
+
 from pyboretum import (
     DecisionTree,
 )
@@ -12,3 +15,33 @@ def test_2d_predict_returns_correct_dimensions(training_data_mrt):
     # Checking the shape of the returned value:
     preds = tree.predict(X[:5])
     assert preds.shape == (5, Y.shape[1])
+
+
+def _traverse(tree, x_row):
+    iterator = tree.tree.get_iterator()
+    while not iterator.is_leaf():
+        node, _ = iterator.get_node()
+        if node.should_take_left(x_row):
+            iterator.left_child()
+        else:
+            iterator.right_child()
+
+    return iterator.get_id(), iterator.get_node()[0]
+
+
+def test_batched_apply_and_predict_match_row_by_row_traversal(training_data_mrt):
+    X, Y = training_data_mrt
+
+    tree = DecisionTree(min_samples_leaf=2)
+    tree.fit(X, Y)
+
+    X_np = np.asarray(X)
+    node_ids = tree.apply(X)
+    preds = np.asarray(tree.predict(X))
+    assert isinstance(node_ids, np.ndarray)
+    assert len(node_ids) == len(X_np)
+
+    for row in range(X_np.shape[0]):
+        node_id, node = _traverse(tree, X_np[row, :])
+        assert node_ids[row] == node_id
+        assert preds[row] == pytest.approx(node.mean)
@@ -1,12 +1,17 @@
+import pickle
+
 import pytest
 import pandas as pd
 import numpy as np
+from scipy import sparse
 
 from pyboretum import (
     Node,
     MeanNode,
+    MeanMedianAnalysisNode,
     TrainingData,
 )
+from pyboretum.node import IdRange
 
 @pytest.fixture()
 def test_X():
@@ -99,3 +104,55 @@ def test_get_label(test_X, test_Y):
     node = MeanNode(test_X, test_Y, np.array([0.0, 1.0]), 3.5)
     assert (node.get_label('mean', test_X.columns) ==
             'N Samples: 3\nAvg y: 4.0\n\nFeature: {}\nThreshold: 3.5'.format([test_X.columns[1]]))
+
+
+def test_node_uses_given_stats_instead_of_Y(test_X, test_Y):
+    node = MeanNode(test_X, test_Y, None, None, stats={np.mean: 100.0, np.median: 200.0})
+    assert node.mean == 100.0
+
+    # Stats are matched by function, not by name:
+    class OtherMeanNode(Node):
+        Y_FUNS = {
+            'mean': np.median,
+        }
+
+    node = OtherMeanNode(test_X, test_Y, None, None, stats={np.mean: 100.0})
+    assert node.mean == 3
+
+
+def test_nodes_have_slots_instead_of_a_dictionary(test_X, test_Y):
+    node = MeanMedianAnalysisNode(test_X, test_Y, np.array([1.0, 0.0]), 1.5, np.arange(3))
+    assert not hasattr(node, '__dict__')
+    assert set(MeanMedianAnalysisNode.__slots__) == {'mean', 'median'}
+
+    copied = pickle.loads(pickle.dumps(node))
+    assert copied.n_samples == 3
+    assert copied.coeffs.tolist() == [1.0, 0.0]
+    assert copied.threshold == 1.5
+    assert copied.mean == 4.0
+    assert copied.median == 3.0
+    assert copied.saved_ids.tolist() == [0, 1, 2]
+
+
+def test_node_resolves_saved_id_ranges(test_X, test_Y):
+    permutation = np.array([7, 5, 3, 1])
+    node = MeanMedianAnalysisNode(test_X, test_Y, None, None, IdRange(permutation, 1, 4))
+    assert node.saved_ids.tolist() == [5, 3, 1]
+
+
+def test_axis_aligned_cuts_compare_a_single_feature(test_X, test_Y):
+    X = test_X.values
+    node = MeanNode(test_X, test_Y, np.array([0.0, 1.0]), 25)
+    assert node.feature == 1
+    assert node.should_take_left(X).tolist() == [True, True, False]
+    assert node.should_take_left(X, np.array([2, 0])).tolist() == [False, True]
+    assert node.should_take_left(sparse.csr_matrix(X), np.array([2, 0])).tolist() == [False, True]
+    assert node.should_take_left(X[2, :]) == False
+
+    # Hyperplane cuts use all coeffs:
+    node = MeanNode(test_X, test_Y, np.array([1.0, 1.0]), 23)
+    assert node.feature is None
+    assert node.should_take_left(X).tolist() == [True, True, False]
+    assert node.should_take_left(X, np.array([2, 0])).tolist() == [False, True]
+
+    assert MeanNode(test_X, test_Y, None, None).feature is None
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyboretum import (
+    DecisionTree,
+    ListTree,
+    LinkedTree,
+    MedianNode,
+    splitters,
+)
+
+
+@pytest.fixture()
+def training_data_sine():
+    rng = np.random.RandomState(0)
+    X = rng.uniform(size=(400, 3))
+    y = np.sin(10 * X[:, 0]) + X[:, 1] + .1 * rng.normal(size=400)
+
+    return X, y
+
+
+@pytest.mark.parametrize('splitter, node_class', [
+    (splitters.MSESplitter(), MedianNode),
+    (splitters.MAESplitter(), MedianNode),
+])
+def test_parallel_fit_builds_the_same_tree(splitter, node_class, training_data_sine):
+    X, y = training_data_sine
+
+    tree = DecisionTree(tree_class=ListTree, node_class=node_class, min_samples_leaf=5)
+    tree.fit(X, y, splitter=splitter)
+
+    parallel_tree = DecisionTree(tree_class=ListTree, node_class=node_class, min_samples_leaf=5,
+                                 n_jobs=2, parallel_min_samples=20)
+    parallel_tree.fit(X, y, splitter=splitter)
+
+    # Node IDs of ListTree only depend on the structure of the tree:
+    assert parallel_tree.get_nodes_and_edges(float('inf')) == tree.get_nodes_and_edges(float('inf'))
+    assert parallel_tree.apply(X).tolist() == tree.apply(X).tolist()
+    assert parallel_tree.predict(X, 'median').tolist() == tree.predict(X, 'median').tolist()
+
+
+def test_parallel_fit_respects_max_depth(training_data_sine):
+    X, y = training_data_sine
+
+    tree = DecisionTree(tree_class=LinkedTree, max_depth=4, n_jobs=2, parallel_min_samples=20)
+    tree.fit(X, y)
+
+    depths = [tree.tree.get_node(node_id)[1] for node_id in set(tree.apply(X))]
+    assert max(depths) == 4
+    assert len(depths) == 16
+
+
+@pytest.mark.parametrize('compile_tree', [False, True])
+def test_parallel_predict_keeps_the_order_of_rows(compile_tree, training_data_sine):
+    X, y = training_data_sine
+
+    tree = DecisionTree(min_samples_leaf=5)
+    tree.fit(X, y)
+    if compile_tree:
+        tree.compile()
+
+    preds = tree.predict(X)
+    assert tree.predict(X, n_jobs=2, block_size=30).tolist() == preds.tolist()
+
+    X_df = pd.DataFrame(X, index=['row_{}'.format(idx) for idx in range(len(X))])
+    preds_df = tree.predict(X_df, n_jobs=-1, block_size=30)
+    assert preds_df.index.tolist() == X_df.index.tolist()
+    assert preds_df.columns.tolist() == list(tree.Y_names)
+    assert preds_df.values.tolist() == preds.tolist()
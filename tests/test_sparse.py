@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from pyboretum import (
+    DecisionTree,
+    MedianNode,
+    TrainingData,
+    splitters,
+)
+from pyboretum.utils import (
+    BINARY_FEATURE,
+    CONSTANT_FEATURE,
+    ORDERED_FEATURE,
+)
+
+
+@pytest.fixture()
+def training_data_one_hot():
+    rng = np.random.RandomState(0)
+    X = np.zeros((500, 30))
+    X[np.arange(500), rng.randint(0, 20, size=500)] = 1.0
+    X[:, 20:25] = rng.normal(size=(500, 5)) * (rng.uniform(size=(500, 5)) < .3)
+    X[:, 25] = rng.randint(0, 3, size=500)
+    y = X[:, :8].sum(axis=1) + X[:, 20] + .1 * rng.normal(size=500)
+
+    return X, y
+
+
+def test_training_data_keeps_sparse_X_in_csc_format(training_data_one_hot):
+    X, y = training_data_one_hot
+    training_data = TrainingData(sparse.csr_matrix(X), y)
+
+    assert sparse.isspmatrix_csc(training_data.X)
+    assert training_data.X.has_sorted_indices
+    assert training_data.index.tolist() == list(range(500))
+    assert training_data.feature_types.tolist() == TrainingData(X, y).feature_types.tolist()
+    assert training_data.feature_types[0] == BINARY_FEATURE
+    assert training_data.feature_types[20] == ORDERED_FEATURE
+    assert training_data.feature_types[29] == CONSTANT_FEATURE
+
+    with pytest.raises(AssertionError):
+        training_data.presort()
+
+
+@pytest.mark.parametrize('splitter_class', [
+    splitters.MSESplitter,
+    splitters.MAESplitter,
+])
+def test_sparse_cutpoints_match_dense(splitter_class, training_data_one_hot):
+    X, y = training_data_one_hot
+    Y = y.reshape(-1, 1)
+    X_sparse = sparse.csc_matrix(X)
+
+    for idx in [20, 21, 25]:
+        for min_samples_leaf in [1, 50]:
+            cutpoint, cost = splitter_class()._get_sparse_cutpoint(X_sparse, idx, Y, min_samples_leaf)
+            expected = splitter_class().get_best_cutpoint(X[:, idx], Y, min_samples_leaf)
+            assert cutpoint == expected[0]
+            assert np.isclose(cost, expected[1])
+
+
+def test_sparse_mse_cost_is_exact_with_a_large_offset(training_data_one_hot):
+    X, y = training_data_one_hot
+    Y = y.reshape(-1, 1) + 1e8
+    X_sparse = sparse.csc_matrix(X)
+
+    for idx in [20, 21, 25]:
+        cutpoint, cost = splitters.MSESplitter()._get_sparse_cutpoint(X_sparse, idx, Y, 5)
+        assert cutpoint == splitters.MSESplitter().get_best_cutpoint(X[:, idx], Y, 5)[0]
+
+        left, right = Y[X[:, idx] <= cutpoint], Y[X[:, idx] > cutpoint]
+        expected = (np.square(left - left.mean()).sum() +
+                    np.square(right - right.mean()).sum()) / len(Y)
+        assert cost == pytest.approx(expected)
+
+    coeffs, cutpoint, _ = splitters.MSESplitter().select_feature_to_cut(X_sparse, Y, 5)
+    expected = splitters.MSESplitter().select_feature_to_cut(X, Y, 5)
+    assert coeffs.tolist() == expected[0].tolist()
+    assert cutpoint == expected[1]
+
+
+@pytest.mark.parametrize('splitter', [
+    splitters.MSESplitter(),
+    splitters.MAESplitter(),
+])
+def test_sparse_fit_builds_the_same_tree(splitter, training_data_one_hot):
+    X, y = training_data_one_hot
+
+    tree = DecisionTree(node_class=MedianNode, min_samples_leaf=5)
+    tree.fit(X, y, splitter=splitter)
+
+    sparse_tree = DecisionTree(node_class=MedianNode, min_samples_leaf=5)
+    sparse_tree.fit(sparse.csc_matrix(X), y, splitter=splitter)
+
+    X_csr = sparse.csr_matrix(X)
+    assert np.array_equal(sparse_tree.predict(X_csr, 'median'), tree.predict(X, 'median'))
+
+    sparse_tree.compile()
+    tree.compile()
+    assert sparse_tree.apply(X_csr).tolist() == tree.apply(X).tolist()
+    assert np.array_equal(sparse_tree.predict(X_csr, 'median'), tree.predict(X, 'median'))
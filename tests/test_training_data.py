@@ -5,6 +5,11 @@ from pyboretum import (
     TrainingData,
     MeanNode,
 )
+from pyboretum.utils import (
+    BINARY_FEATURE,
+    CONSTANT_FEATURE,
+    ORDERED_FEATURE,
+)
 
 
 def test_training_data_turns_pandas_to_numpy(training_data_1d):
@@ -67,3 +72,64 @@ def test_1d_Y_is_transformed_to_2d():
 
     training_data = TrainingData(X, y)
     assert training_data.Y.shape == (4, 1)
+
+
+def test_presorted_indices_are_carried_to_descendants():
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 5, size=(50, 3)).astype(float)
+    Y = rng.normal(size=50)
+
+    training_data = TrainingData(X, Y)
+    assert training_data.sorted_idx is None
+    training_data.presort()
+
+    node = MeanNode(X, Y, np.array([0.0, 1.0, 0.0]), 2.5)
+    for data in training_data.get_descendants(node):
+        assert data.sorted_idx.shape == data.X.shape
+        for idx in range(X.shape[1]):
+            # Positions should sort the column stably just like a fresh sort:
+            expected = np.argsort(data.X[:, idx], kind='mergesort')
+            assert data.sorted_idx[:, idx].tolist() == expected.tolist()
+
+
+def test_feature_types_are_detected_once_and_carried_to_descendants():
+    X = np.array([[0., 0., 0.],
+                  [0., 1., 2.],
+                  [0., 1., 1.],
+                  [0., 0., 3.]])
+    training_data = TrainingData(X, np.arange(4.))
+    assert training_data.feature_types.tolist() == [CONSTANT_FEATURE, BINARY_FEATURE, ORDERED_FEATURE]
+
+    node = MeanNode(X, np.arange(4.), np.array([0.0, 0.0, 1.0]), 1.5)
+    for data in training_data.get_descendants(node):
+        assert data.feature_types is training_data.feature_types
+
+
+def test_in_place_descendants_are_views_of_reordered_rows():
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 5, size=(50, 3)).astype(float)
+    Y = rng.normal(size=50)
+    X_original = X.copy()
+
+    expected = TrainingData(X, Y)
+    expected.presort()
+    expected.bin(4)
+
+    training_data = TrainingData(X, Y)
+    training_data.presort()
+    training_data.bin(4)
+    training_data.partition_in_place()
+
+    node = MeanNode(X, Y, np.array([0.0, 1.0, 0.0]), 2.5)
+    for data, expected_data in zip(training_data.get_descendants(node),
+                                   expected.get_descendants(node)):
+        assert data.in_place
+        assert np.shares_memory(data.X, training_data.X)
+        assert data.X.tolist() == expected_data.X.tolist()
+        assert data.Y.tolist() == expected_data.Y.tolist()
+        assert data.index.tolist() == expected_data.index.tolist()
+        assert data.sorted_idx.tolist() == expected_data.sorted_idx.tolist()
+        assert data.histogram.codes.tolist() == expected_data.histogram.codes.tolist()
+
+    # The input is not modified:
+    assert X.tolist() == X_original.tolist()
@@ -4,6 +4,7 @@ import pytest
 from pyboretum import (
     LinkedTree,
     ListTree,
+    SparseListTree,
     MeanNode,
 )
 
@@ -63,6 +64,7 @@ def test_get_root_id_returns_the_correct_node_for_list_tree(test_nodes):
 @pytest.mark.parametrize('tree_class', [
     LinkedTree,
     ListTree,
+    SparseListTree,
 ])
 def test_get_node_returns_the_correct_node(tree_class, test_nodes):
     tree = tree_class(test_nodes[0])
@@ -107,6 +109,7 @@ def test_get_node_returns_nones_when_the_node_is_not_initialized(test_nodes):
 @pytest.mark.parametrize('tree_class', [
     LinkedTree,
     ListTree,
+    SparseListTree,
 ])
 def test_insert_children_works(tree_class, test_nodes):
     tree = tree_class(test_nodes[0])
@@ -138,6 +141,7 @@ def test_insert_children_works(tree_class, test_nodes):
 @pytest.mark.parametrize('tree_class', [
     LinkedTree,
     ListTree,
+    SparseListTree,
 ])
 def test_get_children_ids(tree_class, test_nodes):
     tree = tree_class(test_nodes[0])
@@ -162,6 +166,7 @@ def test_get_children_ids(tree_class, test_nodes):
 @pytest.mark.parametrize('tree_class', [
     LinkedTree,
     ListTree,
+    SparseListTree,
 ])
 def test_complex_tree(tree_class, test_nodes):
     tree = tree_class(test_nodes[0])
@@ -202,3 +207,25 @@ def test_complex_tree(tree_class, test_nodes):
     returned_node, depth = tree.get_node(returned_right_node_id)
     assert returned_node is test_nodes[4]
     assert depth == 2
+
+
+def test_sparse_list_tree_stores_only_existing_nodes(test_nodes):
+    tree = SparseListTree(test_nodes[0])
+
+    # Grow a chain that always continues on the right:
+    node_id = tree.get_root_id()
+    for depth in range(1, 101):
+        _, node_id = tree.insert_children(node_id, test_nodes[1], test_nodes[2])
+
+    assert node_id == 2 ** 101 - 2
+    assert len(tree._nodes) == 201
+
+    returned_node, depth = tree.get_node(node_id)
+    assert returned_node is test_nodes[2]
+    assert depth == 100
+
+    iterator = tree.get_iterator()
+    while not iterator.is_leaf():
+        iterator.right_child()
+    assert iterator.get_id() == node_id
+    assert iterator.get_node() == (test_nodes[2], 100)
@@ -4,6 +4,7 @@ import pytest
 from pyboretum import (
     LinkedTree,
     ListTree,
+    SparseListTree,
     MeanNode,
 )
 
@@ -31,6 +32,7 @@ def test_nodes():
 @pytest.mark.parametrize('tree_class', [
     LinkedTree,
     ListTree,
+    SparseListTree,
 ])
 def test_complex_tree(tree_class, test_nodes):
     tree = tree_class(test_nodes[0])